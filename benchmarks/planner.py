@@ -0,0 +1,50 @@
+import time
+import argparse
+
+import numpy as np
+
+from benchmarks.run import summarize
+from benchmarks.similar import synthetic_macros
+from src.nutrition import MACROS
+from src.planner import MealPlanner
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Meal planner benchmark on synthetic macros")
+    parser.add_argument("--meals", type=int, default=5000,
+                        help="number of candidate meals")
+    parser.add_argument("--portions", type=int, default=3,
+                        help="number of meals in a plan")
+    parser.add_argument("--targets", type=float, nargs=len(MACROS),
+                        default=[2000, 120, 70, 220], metavar="TARGET")
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    macros = synthetic_macros(args.meals, args.seed)
+    ids = np.arange(1, args.meals + 1)
+    planner = MealPlanner()
+    targets = np.array(args.targets)
+
+    latencies, deviations = [], []
+    start = time.perf_counter()
+    for seed in range(args.plans):
+        plan_start = time.perf_counter()
+        _, _, nutrition = planner.plan(ids, macros, targets, args.portions,
+                                       seed)
+        latencies.append(time.perf_counter() - plan_start)
+        deviations.append(np.abs(nutrition.sum(axis=0) / targets - 1).max())
+    summary = summarize(latencies, time.perf_counter() - start)
+
+    print(f"p50 {summary['p50_ms']:.1f} ms  p90 {summary['p90_ms']:.1f} ms  "
+          f"max {summary['max_ms']:.1f} ms  worst macro deviation "
+          f"median {np.median(deviations) * 100:.1f}%  "
+          f"max {max(deviations) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
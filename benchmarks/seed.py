@@ -0,0 +1,94 @@
+import random
+import datetime
+
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+
+from data.models.user import User
+from data.models.post import Post
+from data.models.subscription import Subscription
+from data.models.dinner import Dinner
+from src.nutrition import NutritionRollup
+
+PASSWORD = "benchmark"
+WORDS = ("chicken", "soup", "salad", "rice", "beef", "pasta", "cheese",
+         "tomato", "bread", "fish", "apple", "pie", "curry", "tofu", "egg")
+
+
+def user_email(index):
+    return f"user{index}@bench.local"
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    BATCH_SIZE = 5000
+
+    def __init__(self, db_sess, seed=0, batch_size=BATCH_SIZE):
+        self.db_sess = db_sess
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+
+    def insert(self, model, rows):
+        count = 0
+        for batch in batched(rows, self.batch_size):
+            self.db_sess.execute(sa.insert(model), batch)
+            self.db_sess.commit()
+            count += len(batch)
+        return count
+
+    def seed(self, users, posts, subscriptions, dinners, days=365):
+        hashed_password = generate_password_hash(PASSWORD)
+        now = datetime.datetime.now()
+        today = datetime.date.today()
+
+        self.insert(User, ({
+            "email": user_email(index),
+            "username": f"user{index}",
+            "age": 18 + index % 60,
+            "hashed_password": hashed_password,
+            "register_date": now
+        } for index in range(users)))
+        user_ids = [user_id for user_id, in self.db_sess.execute(
+            sa.select(User.id).order_by(User.id))]
+
+        self.insert(Post, ({
+            "name": " ".join(self.random.sample(WORDS, 3)) + f" {index}",
+            "author": self.random.choice(user_ids),
+            "calories": self.random.uniform(20, 600),
+            "proteins": self.random.uniform(0, 40),
+            "fats": self.random.uniform(0, 40),
+            "carbonades": self.random.uniform(0, 80),
+            "about": " ".join(self.random.choices(WORDS, k=12)),
+            "update_date": now - datetime.timedelta(minutes=index)
+        } for index in range(posts)))
+        post_ids = [post_id for post_id, in self.db_sess.execute(
+            sa.select(Post.id).order_by(Post.id))]
+
+        pairs = set()
+        subscriptions = min(subscriptions, len(user_ids) * len(post_ids))
+        while len(pairs) < subscriptions:
+            pairs.add((self.random.choice(user_ids),
+                       self.random.choice(post_ids)))
+        self.insert(Subscription, ({"user_id": user_id, "meal_id": meal_id}
+                                   for user_id, meal_id in sorted(pairs)))
+
+        self.insert(Dinner, ({
+            "user_id": self.random.choice(user_ids),
+            "meal_id": self.random.choice(post_ids),
+            "date": today - datetime.timedelta(days=self.random.randrange(days))
+        } for _ in range(dinners)))
+
+        NutritionRollup.rebuild(self.db_sess)
+        self.db_sess.commit()
+
+        return user_ids, post_ids
@@ -0,0 +1,58 @@
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from benchmarks.run import summarize
+from src.similar import MacroIndex
+
+
+def synthetic_macros(meals, seed):
+    generator = np.random.default_rng(seed)
+    proteins = generator.gamma(2, 6, meals)
+    fats = generator.gamma(1.5, 6, meals)
+    carbonades = generator.gamma(2, 15, meals)
+    calories = 4 * proteins + 9 * fats + 4 * carbonades + \
+        generator.normal(0, 20, meals)
+    return np.stack([calories, proteins, fats, carbonades], axis=1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Similar meals index benchmark on synthetic macros")
+    parser.add_argument("--meals", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    macros = synthetic_macros(args.meals, args.seed)
+
+    start = time.perf_counter()
+    index = MacroIndex(np.arange(1, args.meals + 1), macros)
+    print(f"Built index of {args.meals} meals in "
+          f"{time.perf_counter() - start:.2f} s", file=sys.stderr)
+
+    generator = np.random.default_rng(args.seed + 1)
+    queries = index.normalize(
+        macros[generator.integers(0, args.meals, args.queries)])
+
+    latencies = []
+    start = time.perf_counter()
+    for vector in queries:
+        query_start = time.perf_counter()
+        index.nearest(vector, args.limit + 1)
+        latencies.append(time.perf_counter() - query_start)
+    summary = summarize(latencies, time.perf_counter() - start)
+
+    print(f"p50 {summary['p50_ms']:.3f} ms  p90 {summary['p90_ms']:.3f} ms  "
+          f"p99 {summary['p99_ms']:.3f} ms  max {summary['max_ms']:.3f} ms  "
+          f"{summary['throughput_rps']:.0f} queries/s")
+
+
+if __name__ == '__main__':
+    main()
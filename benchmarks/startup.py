@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+from benchmarks.run import RESULTS_DIRECTORY, git_revision
+
+BOOT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from src.wsgi import create_app
+imported = time.perf_counter()
+create_app()
+booted = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000,
+                  "create_app_ms": (booted - imported) * 1000}))
+"""
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def describe(samples):
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1)
+    }
+
+
+def measure_boot(env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", BOOT_SCRIPT], env=env,
+                            capture_output=True, text=True, check=True)
+    total = (time.perf_counter() - start) * 1000
+
+    timings = json.loads(output.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = total
+    return timings
+
+
+def measure_first_response(env, mode, url, timeout):
+    process = subprocess.Popen([sys.executable, "main.py", "--mode", mode],
+                               env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"main.py exited with {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1):
+                    return (time.perf_counter() - start) * 1000
+            except urllib.error.HTTPError:
+                return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise RuntimeError(f"{url} did not answer within {timeout} s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def slowest_imports(env, limit):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             "import src.wsgi"], env=env,
+                            capture_output=True, text=True, check=True)
+
+    imports = []
+    for line in output.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        level = (len(match.group(3)) - 1) // 2
+        if level == 0 and match.group(4) != "src.wsgi":
+            imports = []
+        elif level == 2:
+            imports.append((match.group(4), int(match.group(2)) / 1000))
+
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return [{"module": name, "cumulative_ms": round(elapsed, 1)}
+            for name, elapsed in imports[:limit]]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mealty startup benchmark")
+    parser.add_argument("--database-url", default=None,
+                        help="SQLAlchemy URL, defaults to data/settings.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--schema-check", nargs="*", default=[None],
+                        choices=["startup", "deferred", "off"],
+                        help="schema check modes to compare, defaults to "
+                             "the one in data/settings.json")
+    parser.add_argument("--mode", choices=["development", "production"],
+                        default="development",
+                        help="main.py mode to time until the first response")
+    parser.add_argument("--no-serve", action="store_true",
+                        help="skip starting main.py")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--imports", type=int, default=15,
+                        help="number of slowest imports to report")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    env = dict(os.environ)
+    if args.database_url:
+        env["MEALTY_DATABASE_URL"] = args.database_url
+
+    from src.server_loader import ServerLoader
+    server = ServerLoader(os.path.join("static", "json", "server_data.json"))
+    url = f"http://{server.host}:{server.port}/"
+
+    results = {}
+    for schema_check in args.schema_check:
+        name = schema_check or "configured"
+        run_env = dict(env)
+        if schema_check:
+            run_env["MEALTY_SCHEMA_CHECK"] = schema_check
+
+        print(f"Measuring startup with schema check: {name}", file=sys.stderr)
+        boots = [measure_boot(run_env) for _ in range(args.repeat)]
+        results[name] = {
+            metric: describe([boot[metric] for boot in boots])
+            for metric in ("import_ms", "create_app_ms", "process_ms")
+        }
+        if not args.no_serve:
+            results[name]["first_response_ms"] = describe([
+                measure_first_response(run_env, args.mode, url, args.timeout)
+                for _ in range(args.repeat)])
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parameters": {"repeat": args.repeat, "mode": args.mode},
+        "results": results,
+        "slowest_imports": slowest_imports(env, args.imports)
+    }
+
+    os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+    path = os.path.join(RESULTS_DIRECTORY,
+                        f"startup-{report['timestamp'].replace(':', '')}-"
+                        f"{report['revision']}.json")
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for name, metrics in results.items():
+        print(f"\nschema check {name}:")
+        for metric, summary in metrics.items():
+            print(f"  {metric:<18} median {summary['median_ms']:>8.1f} ms  "
+                  f"min {summary['min_ms']:>8.1f} ms  "
+                  f"max {summary['max_ms']:>8.1f} ms")
+    print("\nslowest imports of src.app:")
+    for item in report["slowest_imports"]:
+        print(f"  {item['module']:<36} {item['cumulative_ms']:>8.1f} ms")
+    print(f"\nResults saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from data.models import user
 from data.models import post
 from data.models import subscription
-from data.models import dinner
\ No newline at end of file
+from data.models import dinner
+from data.models import daily_nutrition
@@ -1,36 +1,348 @@
+import os
 import json
+import time
+import threading
+import itertools
 from os import path
 
 import sqlalchemy as sa
 import sqlalchemy.orm as orm
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 import sqlalchemy.ext.declarative as dec
 
+from flask import g, has_app_context
+
 SqlAlchemyBase = dec.declarative_base()
 
 __factory = None
+__engine = None
+__replicas = None
+__settings = None
 
+POOL_DEFAULTS = {
+    "size": 5,
+    "max_overflow": 10,
+    "timeout": 30,
+    "recycle": 1800,
+    "pre_ping": True
+}
 
-def global_init():
-    global __factory
+REPLICA_DEFAULTS = {
+    "urls": [],
+    "sticky_seconds": 5,
+    "health_interval": 5,
+    "max_lag_seconds": 10
+}
+
+REPLICA_LAG = sa.text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) "
+    "END")
+
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+
+    def record(self, elapsed, timed_out=False):
+        with self.lock:
+            self.waits += 1
+            self.wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+            self.timeouts += int(timed_out)
+
+
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa.exc.TimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+
+class ReplicaSet:
+    def __init__(self, engines, sticky_seconds, health_interval, max_lag):
+        self.engines = engines
+        self.sticky_seconds = sticky_seconds
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.healthy = list(engines)
+        self.counter = itertools.count()
+        self.thread = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+
+        for engine in engines:
+            sa.event.listen(engine, "handle_error", self.handle_error)
+
+    @classmethod
+    def from_settings(cls, urls, settings, create):
+        return cls([create(url) for url in urls], settings["sticky_seconds"],
+                   settings["health_interval"], settings["max_lag_seconds"])
+
+    def pick(self):
+        self.start()
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self.counter) % len(healthy)]
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.monitor,
+                                               name="replica-health",
+                                               daemon=True)
+                self.thread.start()
+
+    def monitor(self):
+        while True:
+            self.check()
+            self.wake.wait(self.health_interval)
+            self.wake.clear()
+
+    def check(self):
+        self.update([engine for engine in self.engines
+                     if self.is_healthy(engine)])
+
+    def update(self, healthy):
+        with self.lock:
+            for engine in set(self.healthy) ^ set(healthy):
+                state = "снова доступна" if engine in healthy else "отключена"
+                print(f"Реплика {engine.url} {state}")
+            self.healthy = healthy
+
+    def is_healthy(self, engine):
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name != "postgresql":
+                    connection.execute(sa.text("SELECT 1"))
+                    return True
+                lag = connection.execute(REPLICA_LAG).scalar()
+        except sa.exc.SQLAlchemyError:
+            return False
+        return lag is None or lag <= self.max_lag
+
+    def handle_error(self, context):
+        if context.is_disconnect or \
+                isinstance(context.sqlalchemy_exception,
+                           sa.exc.OperationalError):
+            self.update([engine for engine in self.healthy
+                         if engine is not context.engine])
+            self.wake.set()
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose(close=False)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, sa.sql.dml.UpdateBase):
+            self.info["wrote"] = True
+            if has_app_context():
+                g.db_wrote = True
+
+        if self.info.get("wrote") or not isinstance(clause, sa.Select) or \
+                clause._for_update_arg is not None or \
+                (has_app_context() and g.get("db_primary", False)):
+            return get_engine()
+        return _pick_replica() or get_engine()
+
+
+def _session_scope():
+    if has_app_context():
+        return id(g._get_current_object())
+    return threading.get_ident()
+
+
+def load_settings():
+    global __settings
+
+    if __settings is None:
+        with open(path.join("data", "settings.json")) as file:
+            __settings = json.load(file)
+    return __settings
+
+
+def _create_engine(url, pool):
+    return sa.create_engine(url, echo=False,
+                            poolclass=TimedQueuePool,
+                            pool_size=pool["size"],
+                            max_overflow=pool["max_overflow"],
+                            pool_timeout=pool["timeout"],
+                            pool_recycle=pool["recycle"],
+                            pool_pre_ping=pool["pre_ping"])
+
+
+def global_init(check_schema=True):
+    global __factory, __engine, __replicas
 
     if __factory:
         return
 
-    with open(path.join("data", "settings.json")) as file:
-        conn_data = json.load(file)
+    conn_data = load_settings()
 
-    conn_str = f'postgresql://{conn_data["pguser"]}:{conn_data["pgpassword"]}@{conn_data["pghost"]}:{conn_data["pgport"]}/{conn_data["pgdb"]}'
+    conn_str = os.environ.get("MEALTY_DATABASE_URL") or f'postgresql://{conn_data["pguser"]}:{conn_data["pgpassword"]}@{conn_data["pghost"]}:{conn_data["pgport"]}/{conn_data["pgdb"]}'
     print(f"Подключение к базе данных по адресу {conn_str}")
 
-    engine = sa.create_engine(conn_str, echo=False)
-    __factory = orm.sessionmaker(bind=engine)
+    pool = {**POOL_DEFAULTS, **conn_data.get("pool", {})}
+    __engine = _create_engine(conn_str, pool)
+
+    replicas = {**REPLICA_DEFAULTS, **conn_data.get("replicas", {})}
+    urls = os.environ.get("MEALTY_REPLICA_URLS")
+    urls = [url.strip() for url in urls.split(",") if url.strip()] \
+        if urls is not None else replicas["urls"]
+    if urls:
+        print(f"Чтение с реплик: {len(urls)}")
+        __replicas = ReplicaSet.from_settings(
+            urls, replicas, lambda url: _create_engine(url, pool))
+        __factory = orm.scoped_session(
+            orm.sessionmaker(class_=RoutingSession),
+            scopefunc=_session_scope)
+    else:
+        __factory = orm.scoped_session(orm.sessionmaker(bind=__engine),
+                                       scopefunc=_session_scope)
 
     from . import __all_models
 
-    SqlAlchemyBase.metadata.create_all(engine)
+    mode = os.environ.get("MEALTY_SCHEMA_CHECK") or \
+        conn_data.get("schema_check", "startup")
+    if not check_schema or mode == "off":
+        return
+    if mode == "deferred":
+        threading.Thread(target=check_schema_revision, daemon=True,
+                         name="schema-check").start()
+    else:
+        check_schema_revision()
+
+
+def check_schema_revision():
+    from . import schema
+
+    try:
+        current = schema.current_revision(__engine)
+    except sa.exc.OperationalError as error:
+        print(f"Не удалось проверить схему базы данных: {error.orig}")
+        return False
+
+    head = schema.head_revision()
+    if current != head:
+        print(f"Схема базы данных устарела (ревизия {current}, последняя "
+              f"{head}), выполните python3 manage.py db upgrade")
+    return current == head
+
+
+def _reset_after_fork():
+    global __factory
+
+    if __engine is not None:
+        __engine.dispose(close=False)
+    if __replicas is not None:
+        __replicas.dispose()
+    if __factory is not None:
+        __factory = orm.scoped_session(__factory.session_factory,
+                                       scopefunc=_session_scope)
+    for engine in get_engines():
+        if engine is not None:
+            engine.pool.stats = PoolStats()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_engine():
+    return __engine
+
+
+def _pick_replica():
+    if __replicas is None:
+        return None
+    return __replicas.pick()
+
+
+def get_engines():
+    if __replicas is None:
+        return [__engine]
+    return [__engine, *__replicas.engines]
+
+
+def use_primary():
+    g.db_primary = True
+
+
+def has_written():
+    return g.get("db_wrote", False)
+
+
+def sticky_seconds():
+    if __replicas is None:
+        return None
+    return __replicas.sticky_seconds
 
 
 def create_session() -> Session:
     global __factory
-    return __factory()
\ No newline at end of file
+    return __factory()
+
+
+def remove_session(exception=None):
+    global __factory
+    if __factory is not None:
+        __factory.remove()
+
+
+def _pool_status(engine, role):
+    pool = engine.pool
+    stats = pool.stats
+    status = {
+        "role": role,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0)
+    }
+
+    with stats.lock:
+        status.update({
+            "checkouts": stats.waits,
+            "wait_seconds_total": round(stats.wait_time, 6),
+            "wait_seconds_max": round(stats.max_wait_time, 6),
+            "timeouts": stats.timeouts
+        })
+    return status
+
+
+def pool_status():
+    pools = [_pool_status(__engine, "primary")]
+    if __replicas is not None:
+        healthy = __replicas.healthy
+        pools += [{**_pool_status(engine, "replica"), "replica": index,
+                   "healthy": int(engine in healthy)}
+                  for index, engine in enumerate(__replicas.engines)]
+    return pools
+
+
+def insert(db_sess: Session, model):
+    if db_sess.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
@@ -0,0 +1,26 @@
+from alembic import context
+
+from data import db_session
+from data.db_session import SqlAlchemyBase
+from data import __all_models
+
+db_session.global_init(check_schema=False)
+engine = db_session.get_engine()
+
+
+
+def include_object(item, name, type_, reflected, compare_to):
+    condition = getattr(item, "_ddl_if", None)
+    return condition is None or \
+        condition.dialect in (None, engine.dialect.name)
+
+
+with engine.connect() as connection:
+    context.configure(connection=connection,
+                      target_metadata=SqlAlchemyBase.metadata,
+                      render_as_batch=engine.dialect.name == "sqlite",
+                      include_object=include_object,
+                      compare_type=True)
+
+    with context.begin_transaction():
+        context.run_migrations()
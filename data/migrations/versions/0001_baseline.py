@@ -0,0 +1,65 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 13:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by create_all before migrations existed already
+    # have these tables, so the baseline only fills in what is missing.
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("username", sa.String, unique=True),
+            sa.Column("email", sa.String, unique=True),
+            sa.Column("age", sa.Integer),
+            sa.Column("hashed_password", sa.String),
+            sa.Column("register_date", sa.DateTime))
+
+    if "posts" not in existing:
+        op.create_table(
+            "posts",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("name", sa.String),
+            sa.Column("author", sa.Integer, sa.ForeignKey("users.id")),
+            sa.Column("calories", sa.Float),
+            sa.Column("proteins", sa.Float),
+            sa.Column("fats", sa.Float),
+            sa.Column("carbonades", sa.Float),
+            sa.Column("update_date", sa.DateTime),
+            sa.Column("about", sa.String))
+
+    if "subscriptions" not in existing:
+        op.create_table(
+            "subscriptions",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id")),
+            sa.Column("meal_id", sa.Integer, sa.ForeignKey("posts.id")))
+
+    if "dinners" not in existing:
+        op.create_table(
+            "dinners",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id")),
+            sa.Column("meal_id", sa.Integer, sa.ForeignKey("posts.id")),
+            sa.Column("date", sa.Date))
+
+
+def downgrade():
+    op.drop_table("dinners")
+    op.drop_table("subscriptions")
+    op.drop_table("posts")
+    op.drop_table("users")
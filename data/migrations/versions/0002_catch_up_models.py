@@ -0,0 +1,96 @@
+"""columns, tables and indexes added after the baseline
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 13:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, " \
+                  "coalesce(name, '') || ' ' || coalesce(about, ''))"
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    posts = {column["name"] for column in inspector.get_columns("posts")}
+    dinners = {column["name"] for column in inspector.get_columns("dinners")}
+    post_indexes = {index["name"] for index in inspector.get_indexes("posts")}
+
+    if "preview" not in posts:
+        op.add_column("posts", sa.Column("preview", sa.String))
+    if "external_id" not in posts:
+        op.add_column("posts", sa.Column("external_id", sa.String))
+        with op.batch_alter_table("posts") as batch:
+            batch.create_unique_constraint("posts_external_id_key",
+                                           ["external_id"])
+
+    op.execute("UPDATE posts SET update_date = CURRENT_TIMESTAMP "
+               "WHERE update_date IS NULL")
+    with op.batch_alter_table("posts") as batch:
+        batch.alter_column("update_date", existing_type=sa.DateTime,
+                           nullable=False)
+
+    if "ix_posts_update_date_id" not in post_indexes:
+        op.create_index("ix_posts_update_date_id", "posts",
+                        ["update_date", "id"])
+
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_posts_search_document "
+                   f"ON posts USING gin ({SEARCH_DOCUMENT})")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_posts_name_trgm "
+                   "ON posts USING gin (name gin_trgm_ops)")
+
+    if "grams" not in dinners:
+        op.add_column("dinners", sa.Column("grams", sa.Float, nullable=False,
+                                           server_default="100"))
+
+    if not inspector.has_table("daily_nutrition"):
+        op.create_table(
+            "daily_nutrition",
+            sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"),
+                      primary_key=True),
+            sa.Column("date", sa.Date, primary_key=True),
+            sa.Column("calories", sa.Float, nullable=False),
+            sa.Column("proteins", sa.Float, nullable=False),
+            sa.Column("fats", sa.Float, nullable=False),
+            sa.Column("carbonades", sa.Float, nullable=False),
+            sa.Column("dinner_count", sa.Integer, nullable=False),
+            sa.Column("update_date", sa.DateTime, nullable=False))
+        op.execute(
+            "INSERT INTO daily_nutrition (user_id, date, calories, proteins, "
+            "fats, carbonades, dinner_count, update_date) "
+            "SELECT dinners.user_id, dinners.date, "
+            "coalesce(sum(posts.calories * dinners.grams / 100), 0), "
+            "coalesce(sum(posts.proteins * dinners.grams / 100), 0), "
+            "coalesce(sum(posts.fats * dinners.grams / 100), 0), "
+            "coalesce(sum(posts.carbonades * dinners.grams / 100), 0), "
+            "count(*), CURRENT_TIMESTAMP "
+            "FROM dinners JOIN posts ON posts.id = dinners.meal_id "
+            "WHERE dinners.user_id IS NOT NULL AND dinners.date IS NOT NULL "
+            "GROUP BY dinners.user_id, dinners.date")
+
+
+def downgrade():
+    op.drop_table("daily_nutrition")
+    op.drop_column("dinners", "grams")
+
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_posts_name_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_posts_search_document")
+    op.drop_index("ix_posts_update_date_id", "posts")
+
+    with op.batch_alter_table("posts") as batch:
+        batch.alter_column("update_date", existing_type=sa.DateTime,
+                           nullable=True)
+        batch.drop_constraint("posts_external_id_key", type_="unique")
+        batch.drop_column("external_id")
+        batch.drop_column("preview")
@@ -0,0 +1,43 @@
+"""deduplicate subscriptions and cache subscriber counts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 13:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    posts = {column["name"] for column in inspector.get_columns("posts")}
+    constraints = {constraint["name"] for constraint
+                   in inspector.get_unique_constraints("subscriptions")}
+
+    if "uq_subscriptions_user_meal" not in constraints:
+        op.execute("DELETE FROM subscriptions WHERE id NOT IN ("
+                   "SELECT min(id) FROM subscriptions "
+                   "GROUP BY user_id, meal_id)")
+        with op.batch_alter_table("subscriptions") as batch:
+            batch.create_unique_constraint("uq_subscriptions_user_meal",
+                                           ["user_id", "meal_id"])
+
+    if "subscribers_count" not in posts:
+        op.add_column("posts", sa.Column("subscribers_count", sa.Integer,
+                                         nullable=False, server_default="0"))
+    op.execute("UPDATE posts SET subscribers_count = ("
+               "SELECT count(*) FROM subscriptions "
+               "WHERE subscriptions.meal_id = posts.id)")
+
+
+def downgrade():
+    with op.batch_alter_table("posts") as batch:
+        batch.drop_column("subscribers_count")
+    with op.batch_alter_table("subscriptions") as batch:
+        batch.drop_constraint("uq_subscriptions_user_meal", type_="unique")
@@ -0,0 +1,36 @@
+"""index foreign keys and dinner dates
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_dinners_user_id_date", "dinners", ["user_id", "date"]),
+    ("ix_dinners_meal_id", "dinners", ["meal_id"]),
+    ("ix_dinners_date", "dinners", ["date"]),
+    ("ix_subscriptions_meal_id", "subscriptions", ["meal_id"]),
+    ("ix_posts_author", "posts", ["author"]),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for name, table, columns in INDEXES:
+        if name not in {index["name"]
+                        for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table)
@@ -0,0 +1,93 @@
+"""partition dinners by month
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+INDEXES = [
+    ("ix_dinners_user_id_date", ["user_id", "date"]),
+    ("ix_dinners_meal_id", ["meal_id"]),
+    ("ix_dinners_date", ["date"]),
+]
+
+
+def is_partitioned(bind):
+    return bind.execute(sa.text(
+        "SELECT relkind = 'p' FROM pg_class "
+        "WHERE oid = to_regclass('dinners')")).scalar()
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def replace_table(bind, partitioned):
+    for name, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute("ALTER TABLE dinners RENAME TO dinners_old")
+    op.execute("ALTER TABLE dinners_old "
+               "RENAME CONSTRAINT dinners_pkey TO dinners_old_pkey")
+    sequence = bind.execute(sa.text(
+        "SELECT pg_get_serial_sequence('dinners_old', 'id')")).scalar()
+
+    op.execute(f"""
+        CREATE TABLE dinners (
+            id integer NOT NULL DEFAULT nextval('{sequence}'::regclass),
+            user_id integer
+                CONSTRAINT dinners_user_id_fkey REFERENCES users (id),
+            meal_id integer
+                CONSTRAINT dinners_meal_id_fkey REFERENCES posts (id),
+            date date {"NOT NULL" if partitioned else ""},
+            grams double precision NOT NULL DEFAULT 100,
+            CONSTRAINT dinners_pkey PRIMARY KEY
+                ({"id, date" if partitioned else "id"})
+        ) {"PARTITION BY RANGE (date)" if partitioned else ""}""")
+
+    if partitioned:
+        op.execute("CREATE TABLE dinners_default PARTITION OF dinners DEFAULT")
+        first = bind.execute(sa.text(
+            "SELECT min(date) FROM dinners_old")).scalar() or \
+            datetime.date.today()
+        month = first.replace(day=1)
+        last = add_months(datetime.date.today().replace(day=1), MONTHS_AHEAD)
+        while month <= last:
+            op.execute(f"CREATE TABLE dinners_y{month.year}m{month.month:02d} "
+                       f"PARTITION OF dinners FOR VALUES FROM ('{month}') "
+                       f"TO ('{add_months(month, 1)}')")
+            month = add_months(month, 1)
+
+    op.execute("INSERT INTO dinners (id, user_id, meal_id, date, grams) "
+               "SELECT id, user_id, meal_id, coalesce(date, CURRENT_DATE), "
+               "grams FROM dinners_old")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY dinners.id")
+    op.execute("DROP TABLE dinners_old")
+
+    for name, columns in INDEXES:
+        op.create_index(name, "dinners", columns)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or is_partitioned(bind):
+        return
+    replace_table(bind, partitioned=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql" or not is_partitioned(bind):
+        return
+    replace_table(bind, partitioned=False)
@@ -0,0 +1,24 @@
+import datetime
+import sqlalchemy
+from data.db_session import SqlAlchemyBase
+
+from sqlalchemy_serializer import SerializerMixin
+
+
+class DailyNutrition(SqlAlchemyBase, SerializerMixin):
+    __tablename__ = "daily_nutrition"
+
+    user_id = sqlalchemy.Column(sqlalchemy.Integer,
+                                sqlalchemy.ForeignKey("users.id"),
+                                primary_key=True)
+    date = sqlalchemy.Column(sqlalchemy.Date, primary_key=True)
+    calories = sqlalchemy.Column(sqlalchemy.Float, default=0, nullable=False)
+    proteins = sqlalchemy.Column(sqlalchemy.Float, default=0, nullable=False)
+    fats = sqlalchemy.Column(sqlalchemy.Float, default=0, nullable=False)
+    carbonades = sqlalchemy.Column(sqlalchemy.Float, default=0, nullable=False)
+    dinner_count = sqlalchemy.Column(sqlalchemy.Integer, default=0,
+                                     nullable=False)
+    update_date = sqlalchemy.Column(sqlalchemy.DateTime,
+                                    default=datetime.datetime.now,
+                                    onupdate=datetime.datetime.now,
+                                    nullable=False)
@@ -1,5 +1,6 @@
 import datetime
 import sqlalchemy
+from sqlalchemy import orm
 from data.db_session import SqlAlchemyBase
 
 from flask_login import UserMixin
@@ -8,9 +9,22 @@ from sqlalchemy_serializer import SerializerMixin
 
 class Dinner(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "dinners"
+    __table_args__ = (
+        sqlalchemy.PrimaryKeyConstraint("id", "date", name="dinners_pkey"),
+        sqlalchemy.Index("ix_dinners_user_id_date", "user_id", "date"),
+        {"postgresql_partition_by": "RANGE (date)"}
+    )
 
-    id = sqlalchemy.Column(sqlalchemy.Integer,
-                           primary_key=True, autoincrement=True)
+    id = sqlalchemy.Column(sqlalchemy.Integer, autoincrement=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"))
-    meal_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"))
-    date = sqlalchemy.Column(sqlalchemy.Date, default=datetime.datetime.now())
+    meal_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"),
+                                index=True)
+    date = sqlalchemy.Column(sqlalchemy.Date, default=datetime.date.today,
+                             nullable=False, index=True)
+    grams = sqlalchemy.Column(sqlalchemy.Float, default=100, nullable=False,
+                              server_default="100")
+
+    user = orm.relationship("User")
+    meal = orm.relationship("Post", back_populates="dinners")
+
+    __mapper_args__ = {"primary_key": [id]}
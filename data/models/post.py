@@ -1,9 +1,21 @@
 import datetime
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
+from sqlalchemy import orm
 from data.db_session import SqlAlchemyBase
 
 from sqlalchemy_serializer import SerializerMixin
 
+SEARCH_CONFIG = sqlalchemy.literal_column("'simple'::regconfig")
+
+
+def search_document(name, about):
+    return sqlalchemy.func.to_tsvector(
+        SEARCH_CONFIG,
+        sqlalchemy.func.coalesce(name, sqlalchemy.literal_column("''")) +
+        sqlalchemy.literal_column("' '") +
+        sqlalchemy.func.coalesce(about, sqlalchemy.literal_column("''")))
+
 
 class Post(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "posts"
@@ -12,11 +24,32 @@ class Post(SqlAlchemyBase, SerializerMixin):
                            primary_key=True, autoincrement=True)
     name = sqlalchemy.Column(sqlalchemy.String)
     author = sqlalchemy.Column(sqlalchemy.Integer,
-                               sqlalchemy.ForeignKey("users.id"))
+                               sqlalchemy.ForeignKey("users.id"), index=True)
     calories = sqlalchemy.Column(sqlalchemy.Float, default=0)
     proteins = sqlalchemy.Column(sqlalchemy.Float, default=0)
     fats = sqlalchemy.Column(sqlalchemy.Float, default=0)
     carbonades = sqlalchemy.Column(sqlalchemy.Float, default=0)
     update_date = sqlalchemy.Column(sqlalchemy.DateTime,
-                                  default=datetime.datetime.now())
+                                    default=datetime.datetime.now,
+                                    nullable=False)
     about = sqlalchemy.Column(sqlalchemy.String)
+    preview = sqlalchemy.Column(sqlalchemy.String)
+    external_id = sqlalchemy.Column(sqlalchemy.String, unique=True)
+    subscribers_count = sqlalchemy.Column(sqlalchemy.Integer, default=0,
+                                          nullable=False, server_default="0")
+
+    creator = orm.relationship("User")
+    subscriptions = orm.relationship("Subscription", back_populates="meal")
+    dinners = orm.relationship("Dinner", back_populates="meal")
+
+    __table_args__ = (
+        sqlalchemy.Index("ix_posts_update_date_id", "update_date", "id"),
+        sqlalchemy.Index("ix_posts_search_document",
+                         search_document(name, about),
+                         postgresql_using="gin").ddl_if(dialect="postgresql"),
+        sqlalchemy.Index("ix_posts_name_trgm", name,
+                         postgresql_using="gin",
+                         postgresql_ops={"name": "gin_trgm_ops"})
+        .ddl_if(dialect="postgresql"),
+    )
+
@@ -1,4 +1,5 @@
 import sqlalchemy
+from sqlalchemy import orm
 from data.db_session import SqlAlchemyBase
 
 from flask_login import UserMixin
@@ -7,8 +8,16 @@ from sqlalchemy_serializer import SerializerMixin
 
 class Subscription(SqlAlchemyBase, SerializerMixin):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        sqlalchemy.UniqueConstraint("user_id", "meal_id",
+                                    name="uq_subscriptions_user_meal"),
+    )
 
     id = sqlalchemy.Column(sqlalchemy.Integer,
                            primary_key=True, autoincrement=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("users.id"))
-    meal_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"))
\ No newline at end of file
+    meal_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("posts.id"),
+                                index=True)
+
+    user = orm.relationship("User")
+    meal = orm.relationship("Post", back_populates="subscriptions")
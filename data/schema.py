@@ -0,0 +1,47 @@
+from os import path
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+MIGRATIONS_DIRECTORY = path.join(path.dirname(__file__), "migrations")
+
+
+def config():
+    alembic_config = Config()
+    alembic_config.set_main_option("script_location", MIGRATIONS_DIRECTORY)
+    return alembic_config
+
+
+def head_revision():
+    return ScriptDirectory.from_config(config()).get_current_head()
+
+
+def current_revision(engine):
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def is_current(engine):
+    return current_revision(engine) == head_revision()
+
+
+def upgrade(revision="head"):
+    command.upgrade(config(), revision)
+
+
+def downgrade(revision):
+    command.downgrade(config(), revision)
+
+
+def stamp(revision):
+    command.stamp(config(), revision)
+
+
+def revision(message, autogenerate=False):
+    command.revision(config(), message=message, autogenerate=autogenerate)
+
+
+def history():
+    command.history(config())
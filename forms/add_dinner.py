@@ -1,8 +1,11 @@
 from flask_wtf import FlaskForm
-from wtforms import SubmitField, StringField
-from wtforms.validators import DataRequired
+from wtforms import SubmitField, StringField, FloatField, DateField
+from wtforms.validators import DataRequired, Optional, NumberRange
 
 
 class DinnerAddForm(FlaskForm):
     name = StringField("Name of meal (required)", validators=[DataRequired()])
-    submit = SubmitField("Add meal")
\ No newline at end of file
+    grams = FloatField("Portion in gramms (100 by default)",
+                       validators=[Optional(), NumberRange(min=0.1)])
+    date = DateField("Date (today by default)", validators=[Optional()])
+    submit = SubmitField("Add meal")
@@ -0,0 +1,10 @@
+from flask_wtf import FlaskForm
+from wtforms import SubmitField, TextAreaField, DateField
+from wtforms.validators import DataRequired, Optional
+
+
+class DinnerBatchForm(FlaskForm):
+    date = DateField("Date (today by default)", validators=[Optional()])
+    items = TextAreaField("Meals, one per line as \"name; gramms\" "
+                          "(required)", validators=[DataRequired()])
+    submit = SubmitField("Add meals")
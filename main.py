@@ -1,8 +1,21 @@
 import os
+import argparse
 from src.server_loader import ServerLoader
-from src.app import App
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["development", "production"],
+                        default=None,
+                        help="override the mode from server_data.json")
+    args = parser.parse_args()
+
     server = ServerLoader(os.path.join("static", "json", "server_data.json"))
-    app = App(__name__).get_app()
-    app.run(server.host, server.port)
+    mode = args.mode or server.mode
+
+    if mode == "production":
+        from src.server import ProductionServer
+        ProductionServer(server).run()
+    else:
+        from src.wsgi import create_app
+        app = create_app()
+        app.run(server.host, server.port)
@@ -0,0 +1,261 @@
+import os
+import sys
+import argparse
+import datetime
+
+from data import db_session, schema
+from data.models.post import Post
+from src.nutrition import NutritionRollup
+from src.images import ImagePipeline, InvalidImage, MEALS_DIRECTORY
+from src.subscriptions import Subscriptions
+from src.meal_io import MealImporter, MealExporter, ImageSource
+from src.charts import ChartRenderer
+from src.assets import StaticAssets
+from src.cache import FragmentCache, SharedVersions
+from src.partitions import DinnerPartitions, PartitionError
+from src.similar import SimilarMeals
+
+
+def migrate(args):
+    if args.action == "upgrade":
+        schema.upgrade(args.revision or "head")
+    elif args.action == "downgrade":
+        schema.downgrade(args.revision or "-1")
+    elif args.action == "stamp":
+        schema.stamp(args.revision or "head")
+    elif args.action == "revision":
+        schema.revision(args.message, autogenerate=args.autogenerate)
+    elif args.action == "history":
+        schema.history()
+    else:
+        print(f"Current revision: {schema.current_revision(db_session.get_engine())}, "
+              f"head: {schema.head_revision()}")
+
+
+def rebuild_nutrition(args):
+    db_sess = db_session.create_session()
+    count = NutritionRollup.rebuild(db_sess, args.user, args.from_date,
+                                    args.to_date)
+    db_sess.commit()
+    db_sess.close()
+    print(f"Rebuilt {count} daily nutrition rows")
+
+
+def recount_subscribers(args):
+    db_sess = db_session.create_session()
+    count = Subscriptions.recount(db_sess)
+    db_sess.commit()
+    db_sess.close()
+    print(f"Recounted subscribers of {count} meals")
+
+
+def convert_previews(args):
+    pipeline = ImagePipeline()
+    db_sess = db_session.create_session()
+
+    started = []
+    for post in db_sess.query(Post).filter(Post.preview.is_(None)):
+        path = os.path.join(MEALS_DIRECTORY, f"{post.id}.jpg")
+        if not os.path.exists(path):
+            continue
+
+        try:
+            with open(path, "rb") as file:
+                started.append((post, pipeline.start(file)))
+        except InvalidImage as error:
+            print(f"Skipping meal {post.id}: {error}")
+
+    converted = 0
+    for post, digest in started:
+        post.preview = pipeline.finish(digest)
+        converted += post.preview is not None
+
+    db_sess.commit()
+    db_sess.close()
+    pipeline.executor.shutdown(wait=True)
+    print(f"Converted {converted} meal previews")
+
+
+def partitions(args):
+    manager = DinnerPartitions.from_settings(
+        db_session.get_engine(),
+        db_session.load_settings().get("dinner_partitions", {}))
+
+    try:
+        if args.action == "ensure":
+            for name, moved in manager.ensure():
+                print(f"Created partition {name}, moved {moved} rows "
+                      f"from {manager.DEFAULT_PARTITION}")
+        elif args.action == "archive":
+            for name, rows, path in manager.archive(args.keep_months):
+                print(f"Archived {rows} dinners of {name} to {path}")
+        elif args.action == "explain":
+            to_date = args.to_date or datetime.date.today()
+            from_date = args.from_date or to_date - datetime.timedelta(30)
+            scanned, total = manager.explain(args.user, from_date, to_date)
+            print(f"Scans {len(scanned)} of {total} partitions: "
+                  f"{', '.join(scanned)}")
+        else:
+            for name, month, size in manager.describe():
+                print(f"{name:<20} {size / 1024 / 1024:>10.1f} MB")
+    except PartitionError as error:
+        print(error)
+        sys.exit(1)
+
+
+def build_assets(args):
+    assets = StaticAssets(fingerprinted=(ImagePipeline.is_fingerprinted,
+                                         ChartRenderer.is_fingerprinted))
+    files = assets.build()
+    compressed = sum(1 for entry in files.values() if entry["encodings"])
+    print(f"Fingerprinted {len(files)} static files, "
+          f"{compressed} with precompressed variants")
+
+
+def parse_date(value):
+    return datetime.date.fromisoformat(value)
+
+
+def detect_format(path, data_format):
+    if data_format:
+        return data_format
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+
+def import_meals(args):
+    pipeline = ImagePipeline() if args.images else None
+    images = ImageSource(args.images) if args.images else None
+    db_sess = db_session.create_session()
+    importer = MealImporter(db_sess, author=args.author, images=images,
+                            pipeline=pipeline, batch_size=args.batch_size)
+
+    settings = db_session.load_settings()
+    versions = SharedVersions.from_settings(settings.get("cache_versions", {}))
+    fragments = FragmentCache.from_settings(settings.get("fragment_cache", {}),
+                                            versions)
+
+    with open(args.path, "rb") as file:
+        records = importer.read(file, detect_format(args.path, args.format))
+        for result in importer.run(records):
+            for meal_id in result.updated_ids:
+                fragments.invalidate_meal(meal_id)
+            result.updated_ids.clear()
+            if result.written:
+                versions.bump(SimilarMeals.VERSION_KEY)
+                result.written.clear()
+            fragments.invalidate_feeds()
+            print(f"Processed {result.processed} rows: "
+                  f"{result.inserted} inserted, {result.updated} updated, "
+                  f"{len(result.errors)} errors", file=sys.stderr)
+
+    for error in result.errors:
+        print(f"Line {error['line']}: {error['error']}", file=sys.stderr)
+
+    db_sess.close()
+    if images is not None:
+        images.close()
+        pipeline.executor.shutdown(wait=True)
+
+
+def export_meals(args):
+    db_sess = db_session.create_session()
+    exporter = MealExporter(db_sess)
+    chunks = exporter.csv() if detect_format(args.path, args.format) == "csv" \
+        else exporter.jsonl()
+
+    with open(args.path, "w", encoding="utf-8", newline="") as file:
+        for chunk in chunks:
+            file.write(chunk)
+    db_sess.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mealty maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    database = commands.add_parser("db", help="apply and manage schema "
+                                              "migrations")
+    database.add_argument("action", choices=["upgrade", "downgrade", "stamp",
+                                             "current", "history",
+                                             "revision"])
+    database.add_argument("revision", nargs="?", default=None)
+    database.add_argument("-m", "--message", default=None,
+                          help="description of a new revision")
+    database.add_argument("--autogenerate", action="store_true",
+                          help="diff the models against the database "
+                               "for a new revision")
+    database.set_defaults(handler=migrate, check_schema=False)
+
+    rebuild = commands.add_parser("rebuild-nutrition",
+                                  help="recompute the daily nutrition rollup "
+                                       "from the dinners log")
+    rebuild.add_argument("--user", type=int, default=None,
+                         help="only rebuild rows of this user")
+    rebuild.add_argument("--from", dest="from_date", type=parse_date,
+                         default=None, help="first date to rebuild, "
+                                            "YYYY-MM-DD")
+    rebuild.add_argument("--to", dest="to_date", type=parse_date,
+                         default=None, help="last date to rebuild, "
+                                            "YYYY-MM-DD")
+    rebuild.set_defaults(handler=rebuild_nutrition)
+
+    recount = commands.add_parser("recount-subscribers",
+                                  help="recompute cached subscriber counts "
+                                       "of all meals")
+    recount.set_defaults(handler=recount_subscribers)
+
+    previews = commands.add_parser("convert-previews",
+                                   help="run legacy <id>.jpg meal previews "
+                                        "through the image pipeline")
+    previews.set_defaults(handler=convert_previews)
+
+    partition = commands.add_parser("partitions",
+                                    help="manage monthly partitions of "
+                                         "the dinners table")
+    partition.add_argument("action", choices=["list", "ensure", "archive",
+                                              "explain"])
+    partition.add_argument("--keep-months", type=int, default=None,
+                           help="archive partitions older than this many "
+                                "months, overrides retention_months")
+    partition.add_argument("--user", type=int, default=1,
+                           help="user of the range query to explain")
+    partition.add_argument("--from", dest="from_date", type=parse_date,
+                           default=None)
+    partition.add_argument("--to", dest="to_date", type=parse_date,
+                           default=None)
+    partition.set_defaults(handler=partitions, check_schema=False)
+
+    assets = commands.add_parser("build-assets",
+                                 help="write the static files manifest with "
+                                      "versioned URLs and precompressed "
+                                      "gzip/brotli variants")
+    assets.set_defaults(handler=build_assets, check_schema=False)
+
+    importer = commands.add_parser("import-meals",
+                                   help="stream meals from a CSV or JSON "
+                                        "Lines file into the database")
+    importer.add_argument("path")
+    importer.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    importer.add_argument("--images", default=None,
+                          help="directory or zip archive with the files "
+                               "named in the image column")
+    importer.add_argument("--author", type=int, default=None,
+                          help="user id to set as the author of new meals")
+    importer.add_argument("--batch-size", type=int,
+                          default=MealImporter.BATCH_SIZE)
+    importer.set_defaults(handler=import_meals)
+
+    exporter = commands.add_parser("export-meals",
+                                   help="stream all meals to a CSV or JSON "
+                                        "Lines file")
+    exporter.add_argument("path")
+    exporter.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    exporter.set_defaults(handler=export_meals)
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    db_session.global_init(getattr(args, "check_schema", True))
+    args.handler(args)
@@ -1 +1,4 @@
+python3 manage.py db upgrade
+python3 manage.py partitions ensure
+python3 manage.py build-assets
 python3 main.py
\ No newline at end of file
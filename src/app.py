@@ -1,9 +1,18 @@
-import os
+import json
+import time
+import hashlib
+import ipaddress
+import threading
 import datetime
+from types import SimpleNamespace
+from urllib.parse import urlencode
 
-from flask import Flask, render_template, redirect
+from flask import Flask, render_template, redirect, request, jsonify, \
+    make_response, abort, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, \
     current_user
+import sqlalchemy as sa
+from sqlalchemy import orm
 
 from data import db_session
 from data.models.user import User
@@ -17,76 +26,178 @@ from forms.add_meal import MealAddForm
 from forms.change_meal import ChangeMealForm
 from forms.search import MangaSearchForm
 from forms.add_dinner import DinnerAddForm
+from forms.add_dinners import DinnerBatchForm
 from forms.check_cpfc import CheckCPFC
 
-import matplotlib.pyplot as plt
-import numpy as np
+from src.feed import MealFeed
+from src.search import MealSearch
+from src.subscriptions import Subscriptions
+from src.nutrition import NutritionReport, NutritionRollup, MACROS, \
+    DinnerLog, DinnerLogError, is_valid_portion
+from src.charts import ChartRenderer
+from src.images import ImagePipeline, InvalidImage
+from src.user_cache import UserCache
+from src.passwords import PasswordHasher, PasswordHasherBusy
+from src.cache import FragmentCache, SharedVersions
+from src.assets import StaticAssets
+from src.instrumentation import Instrumentation
+from src.meal_io import MealImporter, MealExporter, MealImportError, \
+    ImageSource
+from src.partitions import DinnerPartitions
+
+PRIMARY_COOKIE = "mealty_primary"
+COUNTERS = {"checkouts": "checkouts_total", "timeouts": "timeouts_total",
+            "hits": "hits_total", "misses": "misses_total"}
+INTERNAL_NETWORKS = ["127.0.0.0/8", "::1/128"]
+
 
 class App:
     def __init__(self, namespace):
-        self.app = Flask(namespace)
+        self.app = Flask(namespace, static_folder=None)
+        self.feed = MealFeed()
+        self.meal_search = MealSearch()
+        self.charts = ChartRenderer()
+        self.images = ImagePipeline()
+        self.assets = StaticAssets(fingerprinted=(
+            ImagePipeline.is_fingerprinted, ChartRenderer.is_fingerprinted))
+        self.versions = SharedVersions.from_settings(
+            db_session.load_settings().get("cache_versions", {}))
+        self.fragments = FragmentCache.from_settings(
+            db_session.load_settings().get("fragment_cache", {}),
+            self.versions)
+        self.similar_meals = None
+        self.similar_lock = threading.Lock()
+        self.planner = None
+        self.partitions = None
+        self.passwords = PasswordHasher.from_settings(
+            db_session.load_settings().get("passwords", {}))
+        self.internal_networks = [
+            ipaddress.ip_network(network) for network in
+            db_session.load_settings().get("status", {}).get(
+                "internal_networks", INTERNAL_NETWORKS)]
         self.config()
         self.build_db_session()
+        self.build_instrumentation()
         self.build_login_manager()
         self.build_app()
 
     def config(self):
         self.app.config["SECRET_KEY"] = "AM_AM_AM"
+        self.app.config["MAX_CONTENT_LENGTH"] = \
+            ImagePipeline.MAX_UPLOAD_BYTES + 1024 * 1024
+        self.app.jinja_env.globals["preview_url"] = self.preview_url
+        self.app.jinja_env.globals["asset_url"] = self.assets.url
 
     def build_app(self):
+        self.app.add_url_rule("/static/<path:filename>", endpoint="static",
+                              view_func=self.assets.send)
+
         @self.app.route("/")
         @self.app.route("/meals")
         def meals():
-            db_sess = db_session.create_session()
-            posts = db_sess.query(Post).all()
-
-            recent_posts = sorted(posts,
-                                  key=lambda post: post.update_date)[::-1][:10]
+            cards = self.fragments.get_or_set(
+                self.fragments.feed_key("home"),
+                lambda: self.render_cards(
+                    self.feed.recent(db_session.create_session())))
 
-            db_sess.close()
             return render_template("meals.html", title="Fan-Manga",
-                                   recent_posts=recent_posts)
+                                   cards=cards)
 
         @self.app.route("/meals/search", methods=["GET", "POST"])
         def search():
             form = MangaSearchForm()
 
-            if not form.validate_on_submit():
+            if form.validate_on_submit():
+                return redirect(f"/meals/search?{urlencode({'q': form.name.data})}")
+
+            text = request.args.get("q", "").strip()
+            if not text:
                 return render_template("search.html", found=True, form=form)
-            
+
+            page = max(request.args.get("page", 1, type=int), 1)
+
             db_sess = db_session.create_session()
-            posts = db_sess.query(Post).filter(Post.name == form.name.data).all()
-            db_sess.close()
+            posts, has_next = self.meal_search.search(db_sess, text, page)
             if len(posts) == 0:
+                form.name.data = text
                 return render_template("search.html", found=False, form=form)
 
+            next_url = None
+            if has_next:
+                next_url = f"/meals/search?{urlencode({'q': text, 'page': page + 1})}"
+
             return render_template("filtered_meals.html", title="Results",
-                                   filter_type="Found named", posts=posts)
+                                   filter_type="Found named",
+                                   cards=self.render_cards(posts),
+                                   next_url=next_url)
+
+        @self.app.route("/api/meals/autocomplete")
+        def autocomplete():
+            prefix = request.args.get("q", "").strip()
+            if not prefix:
+                return jsonify([])
+
+            db_sess = db_session.create_session()
+            names = self.meal_search.autocomplete(db_sess, prefix)
+            return jsonify(names)
 
         @self.app.route("/meals/recent")
         def recent_meals():
-            db_sess = db_session.create_session()
-            posts = db_sess.query(Post).all()
-            recent_posts = sorted(posts,
-                                  key=lambda post: post.update_date)[::-1]
+            cursor = request.args.get("cursor")
+
+            def render_page():
+                db_sess = db_session.create_session()
+                recent_posts, next_cursor = self.feed.page(db_sess, cursor)
+                return self.render_cards(recent_posts), next_cursor
+
+            cards, next_cursor = self.fragments.get_or_set(
+                self.fragments.feed_key("recent", cursor), render_page)
 
-            db_sess.close()
             return render_template("filtered_meals.html", title="Recent meals",
-                                   filter_type="Recent", posts=recent_posts)
+                                   filter_type="Recent", cards=cards,
+                                   next_url=f"/meals/recent?cursor={next_cursor}"
+                                   if next_cursor else None)
 
         @self.app.route("/meals/<int:meal_id>", methods=["GET"])
         def meal_page(meal_id):
-            db_sess = db_session.create_session()
-            meal = db_sess.query(Post).filter(Post.id == meal_id).first()
+            meal = self.fragments.get_or_set(
+                self.fragments.meal_key("meal", meal_id),
+                lambda: self.load_meal(meal_id))
+            if meal is None:
+                abort(404)
+
+            subscribed = current_user.is_authenticated and \
+                Subscriptions.is_subscribed(db_session.create_session(),
+                                            current_user.id, meal_id)
 
-            author = db_sess.query(User).filter(User.id == meal.author).first()
+            similar_cards = self.fragments.get_or_set(
+                self.fragments.meal_key("similar", meal_id),
+                lambda: self.render_similar(meal))
 
-            db_sess.close()
             return render_template("meal_page.html", title=meal.name,
                                    meal=meal,
-                                   author=author,
+                                   author=meal.creator,
+                                   subscribed=subscribed,
+                                   similar_cards=similar_cards,
                                    current_user=current_user)
 
+        @self.app.route("/api/meals/<int:meal_id>/similar")
+        def similar_data(meal_id):
+            meal = self.fragments.get_or_set(
+                self.fragments.meal_key("meal", meal_id),
+                lambda: self.load_meal(meal_id))
+            if meal is None:
+                abort(404)
+
+            similar_meals = self.get_similar_meals()
+            similar = similar_meals.similar(
+                meal.id, [getattr(meal, macro) for macro in MACROS],
+                request.args.get("limit", similar_meals.LIMIT, type=int))
+            return jsonify({"meal_id": meal.id,
+                            "ready": similar_meals.ready.is_set(),
+                            "similar": [{**item, "url": f"/meals/{item['id']}"}
+                                        for item in similar]})
+
         @self.app.route("/meals/add_meal", methods=["GET", "POST"])
         def add_meal():
             if not current_user.is_authenticated:
@@ -97,6 +208,12 @@ class App:
             if not form.validate_on_submit():
                 return render_template("add_meal.html", title="Add meal", form=form)
 
+            try:
+                preview = self.images.process(form.preview.data)
+            except InvalidImage as error:
+                return render_template("add_meal.html", title="Add meal",
+                                       form=form, message=str(error))
+
             db_sess = db_session.create_session()
 
             post = Post(
@@ -106,18 +223,16 @@ class App:
                 proteins=form.proteins.data,
                 fats=form.fats.data,
                 carbonades=form.carbonades.data,
-                about=form.about.data
+                about=form.about.data,
+                preview=preview
             )
 
             db_sess.add(post)
             db_sess.commit()
-
-            os.makedirs(os.path.join("static", "image", "meals"))
-
-            preview = form.preview.data
-            preview.save(os.path.join("static", "image", "meals", f"{post.id}.jpg"))
-
-            db_sess.close()
+            self.fragments.invalidate_feeds()
+            if self.similar_meals is not None:
+                self.similar_meals.update(post.id, [getattr(post, macro)
+                                                    for macro in MACROS])
 
             return redirect(f"/meals/{post.id}")
 
@@ -131,13 +246,11 @@ class App:
             meal = db_sess.query(Post).filter(Post.id == meal_id).first()
 
             if not (current_user.id == meal.author):
-                db_sess.close()
                 return redirect(f"/meals/{meal_id}")
 
             form = ChangeMealForm()
 
             if not form.validate_on_submit():
-                db_sess.close()
                 return render_template("change_meal.html",
                                     title="Change meal",
                                     form=form,
@@ -145,13 +258,26 @@ class App:
 
             if not (form.name.data or form.calories.data or form.proteins.data or form.fats.data or form.carbonades.data \
                     or form.about.data or form.preview.data):
-                db_sess.close()
                 return render_template("change_meal.html",
                                         title="Change meal",
                                         form=form,
                                         meal=meal,
                                         message="At least something needs to be changed")
 
+            preview = None
+            if form.preview.data:
+                try:
+                    preview = self.images.process(form.preview.data)
+                except InvalidImage as error:
+                    return render_template("change_meal.html",
+                                           title="Change meal",
+                                           form=form,
+                                           meal=meal,
+                                           message=str(error))
+
+            db_sess.refresh(meal, with_for_update=True)
+            old_values = {macro: getattr(meal, macro) for macro in MACROS}
+
             meal.name = form.name.data if form.name.data else meal.name
             meal.calories = form.calories.data if form.calories.data else meal.calories
             meal.proteins = form.proteins.data if form.proteins.data else meal.proteins
@@ -160,16 +286,20 @@ class App:
             meal.about = form.about.data if form.about.data else meal.about
             meal.update_date = datetime.datetime.now()
 
-            preview = form.preview.data
-            if preview is not None:
-                if not os.path.exists(os.path.join("static", "image", "meals")):
-                    os.makedirs(os.path.join("static", "image", "meals"))
+            NutritionRollup.change_meal(
+                db_sess, meal.id, old_values,
+                {macro: float(getattr(meal, macro)) for macro in MACROS})
 
-                preview.save(os.path.join("static", "image", "meals", f"{meal.id}.jpg"))
+            if preview is not None:
+                meal.preview = preview
 
             db_sess.add(meal)
             db_sess.commit()
-            db_sess.close()
+            self.fragments.invalidate_meal(meal_id)
+            self.fragments.invalidate_feeds()
+            if self.similar_meals is not None:
+                self.similar_meals.update(meal.id, [getattr(meal, macro)
+                                                    for macro in MACROS])
             return redirect("/")
 
         @self.app.route("/meals/<int:meal_id>/sub")
@@ -178,15 +308,21 @@ class App:
                 return redirect(f"/meals/{meal_id}")
             
             db_sess = db_session.create_session()
-            
-            sub = Subscription(
-                user_id = current_user.id,
-                meal_id = meal_id
-            )
+            if Subscriptions.subscribe(db_sess, current_user.id, meal_id):
+                db_sess.commit()
+                self.fragments.invalidate_meal(meal_id)
 
-            db_sess.add(sub)
-            db_sess.commit()
-            db_sess.close()
+            return redirect(f"/meals/{meal_id}")
+
+        @self.app.route("/meals/<int:meal_id>/unsub")
+        def unsubscribe(meal_id):
+            if not current_user.is_authenticated:
+                return redirect(f"/meals/{meal_id}")
+
+            db_sess = db_session.create_session()
+            if Subscriptions.unsubscribe(db_sess, current_user.id, meal_id):
+                db_sess.commit()
+                self.fragments.invalidate_meal(meal_id)
 
             return redirect(f"/meals/{meal_id}")
 
@@ -205,11 +341,22 @@ class App:
                 db_sess = db_session.create_session()
                 user = db_sess.query(User).filter(
                     User.email == form.email.data).first()
-                if user and user.check_password(form.password.data):
-                    login_user(user, remember=form.remember_me.data)
-                    db_sess.close()
-                    return redirect("/account/page")
-                db_sess.close()
+                try:
+                    if user and self.passwords.verify(user.hashed_password,
+                                                      form.password.data):
+                        if self.passwords.needs_rehash(user.hashed_password):
+                            user.hashed_password = self.passwords.hash(
+                                form.password.data)
+                            db_sess.commit()
+                        login_user(self.user_cache.put(user),
+                                   remember=form.remember_me.data)
+                        return redirect("/account/page")
+                except PasswordHasherBusy:
+                    return render_template("login.html",
+                                           title="Authorisation",
+                                           message="Server is busy, " +
+                                                   "try again later",
+                                           form=form), 503
                 return render_template("login.html",
                                        title="Authorisation",
                                        message="Invalid login or password",
@@ -228,35 +375,32 @@ class App:
                                            title="Registration",
                                            form=form,
                                            message="Passwords don`t match")
-                db_sess = db_session.create_session()
-
-                if db_sess.query(User).filter(
-                        User.username == form.username.data).first():
-                    db_sess.close()
+                try:
+                    hashed_password = self.passwords.hash(form.password.data)
+                except PasswordHasherBusy:
                     return render_template("register.html",
                                            title="Registration",
                                            form=form,
-                                           message="This username is " +
-                                                   "already taken")
+                                           message="Server is busy, " +
+                                                   "try again later"), 503
 
-                if db_sess.query(User).filter(
-                        User.email == form.email.data).first():
-                    db_sess.close()
+                db_sess = db_session.create_session()
+                try:
+                    db_sess.execute(sa.insert(User).values(
+                        email=form.email.data,
+                        username=form.username.data,
+                        age=form.age.data,
+                        hashed_password=hashed_password))
+                    db_sess.commit()
+                except sa.exc.IntegrityError as error:
+                    db_sess.rollback()
+                    message = "This username is already taken" \
+                        if "username" in str(error.orig).splitlines()[0] \
+                        else "User with this email already exists"
                     return render_template("register.html",
                                            title="Registration",
                                            form=form,
-                                           message="User with this email " +
-                                                   "already exists")
-
-                user = User(
-                    email=form.email.data,
-                    username=form.username.data,
-                    age=form.age.data
-                )
-                user.set_password(form.password.data)
-                db_sess.add(user)
-                db_sess.commit()
-                db_sess.close()
+                                           message=message)
                 return redirect("/account/login")
 
             return render_template("register.html",
@@ -266,6 +410,7 @@ class App:
         @self.app.route("/account/logout")
         @login_required
         def logout():
+            self.user_cache.invalidate(current_user.id)
             logout_user()
             return redirect("/")
 
@@ -276,13 +421,11 @@ class App:
             
             db_sess = db_session.create_session()
             
-            subscriptions = db_sess.query(Subscription).filter(Subscription.user_id == current_user.id).all()
-            post_subs = []
-            for sub in subscriptions:
-                post = db_sess.query(Post).filter(Post.id == sub.meal_id).first()
-                post_subs.append(post)
+            subscriptions = db_sess.query(Subscription) \
+                .options(orm.joinedload(Subscription.meal)) \
+                .filter(Subscription.user_id == current_user.id).all()
+            post_subs = [sub.meal for sub in subscriptions]
 
-            db_sess.close()
             return render_template("account.html",
                                    title="Account",
                                    user=current_user,
@@ -298,30 +441,82 @@ class App:
             if not form.validate_on_submit():
                 return render_template("add_dinner.html", title="Add dinner", form=form)
 
+            if not is_valid_portion(form.grams.data):
+                return render_template("add_dinner.html",
+                                       title="Add dinner",
+                                       form=form,
+                                       message="Portion must be a positive "
+                                               "number!")
+
             db_sess = db_session.create_session()
             
-            meal = db_sess.query(Post).filter(Post.name == form.name.data).first()
+            meal = db_sess.query(Post).filter(Post.name == form.name.data) \
+                .with_for_update(read=True).first()
 
             if meal is None:
-                db_sess.close()
+                suggestions = self.meal_search.suggest(db_sess, form.name.data)
                 return render_template("add_dinner.html",
                                         title="Add dinner",
                                         form=form,
-                                        message="No meal found with such name!")
+                                        message="No meal found with such name!",
+                                        suggestions=suggestions)
 
             dinner = Dinner(
                 user_id=current_user.id,
                 meal_id=meal.id,
-                date=datetime.date.today()
+                grams=form.grams.data or 100,
+                date=form.date.data or datetime.date.today()
             )
 
             db_sess.add(dinner)
+            NutritionRollup.add_dinner(db_sess, dinner, meal)
             db_sess.commit()
-
-            db_sess.close()
+            self.charts.invalidate(current_user.id)
 
             return redirect(f"/account")
         
+        @self.app.route("/account/add_dinners", methods=["POST", "GET"])
+        def add_dinners():
+            if not current_user.is_authenticated:
+                return redirect("/login")
+
+            form = DinnerBatchForm()
+
+            if not form.validate_on_submit():
+                return render_template("add_dinners.html", title="Log meals",
+                                       form=form)
+
+            db_sess = db_session.create_session()
+            try:
+                items = self.parse_dinner_lines(form.items.data,
+                                                form.date.data)
+                DinnerLog(db_sess, current_user.id).log(items)
+            except DinnerLogError as error:
+                db_sess.rollback()
+                return render_template("add_dinners.html", title="Log meals",
+                                       form=form, message=str(error))
+
+            db_sess.commit()
+            self.charts.invalidate(current_user.id)
+            return redirect("/account")
+
+        @self.app.route("/api/account/dinners", methods=["POST"])
+        def log_dinners():
+            if not current_user.is_authenticated:
+                return jsonify(error="Authorisation required"), 401
+
+            db_sess = db_session.create_session()
+            try:
+                items = self.parse_dinner_items(request.get_json(silent=True))
+                dinners = DinnerLog(db_sess, current_user.id).log(items)
+            except DinnerLogError as error:
+                db_sess.rollback()
+                return jsonify(error=str(error)), 400
+
+            db_sess.commit()
+            self.charts.invalidate(current_user.id)
+            return jsonify(logged=len(dinners)), 201
+
         @self.app.route("/account/check_cpfc", methods=["POST", "GET"])
         def check_cpfc():
             if not current_user.is_authenticated:
@@ -337,61 +532,410 @@ class App:
 
             db_sess = db_session.create_session()
 
-            dinners = db_sess.query(Dinner).filter(Dinner.user_id == current_user.id)
-            dinners = dinners.filter(Dinner.date >= from_date)
-            dinners = dinners.filter(Dinner.date <= to_date).all()
-
-            cal_stat = {}
-            p_stat = {}
-            f_stat = {}
-            car_stat = {}
-            for dinner in dinners:
-                meal = db_sess.query(Post).filter(Post.id == dinner.meal_id).first()
-                if str(dinner.date) not in cal_stat.keys():
-                    cal_stat[str(dinner.date)] = 0
-                cal_stat[str(dinner.date)] += meal.calories
-                if str(dinner.date) not in p_stat.keys():
-                    p_stat[str(dinner.date)] = 0
-                p_stat[str(dinner.date)] += meal.proteins
-                if str(dinner.date) not in f_stat.keys():
-                    f_stat[str(dinner.date)] = 0
-                f_stat[str(dinner.date)] += meal.fats
-                if str(dinner.date) not in car_stat.keys():
-                    car_stat[str(dinner.date)] = 0
-                car_stat[str(dinner.date)] += meal.carbonades
-            
-            fig, ax = plt.subplots()
-            grid = cal_stat.keys()
+            report = NutritionReport.load(db_sess, current_user.id,
+                                          from_date, to_date)
+            with self.instrumentation.timer("chart"):
+                impath, ready = self.charts.render(current_user.id, report)
 
-            ax.bar(grid, cal_stat.values(), label="Calories")
-            ax.set_xlabel("Date")
-            ax.set_ylabel("Amount")
-            ax.set_title("Calories")
+            return render_template("check_cpfc.html", title="Check CPFC",
+                                   form=form, impath=impath, ready=ready)
 
-            if not os.path.exists(os.path.join("static", "image", "graphics", f"{current_user.id}")):
-                os.makedirs(os.path.join("static", "image", "graphics", f"{current_user.id}"))
-            
-            fig.savefig(os.path.join("static", "image", "graphics", f"{current_user.id}", f'{from_date}-{to_date}.png'))
-            return render_template("check_cpfc.html", title="Check CPFC", form=form, 
-                                   impath=os.path.join("static", "image", "graphics", f"{current_user.id}", f'{from_date}-{to_date}.png'))
+        @self.app.route("/api/account/cpfc")
+        def cpfc_data():
+            if not current_user.is_authenticated:
+                return jsonify(error="Authorisation required"), 401
+
+            try:
+                from_date = datetime.date.fromisoformat(request.args["from"])
+                to_date = datetime.date.fromisoformat(request.args["to"])
+            except (KeyError, ValueError):
+                return jsonify(error="Parameters from and to must be "
+                                     "dates in YYYY-MM-DD format"), 400
 
+            data_format = request.args.get("format", "json")
+            if data_format not in ("json", "csv"):
+                return jsonify(error="Format must be json or csv"), 400
+
+            db_sess = db_session.create_session()
+            count, last_modified = NutritionReport.version(
+                db_sess, current_user.id, from_date, to_date)
+            etag = hashlib.sha1(
+                f"{current_user.id}:{from_date}:{to_date}:{count}:"
+                f"{last_modified}:{data_format}".encode()).hexdigest()
+
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0) \
+                    .astimezone(datetime.timezone.utc)
+
+            response = make_response()
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+
+            if self.not_modified(etag, last_modified):
+                response.status_code = 304
+                return response
+
+            report = NutritionReport.load(db_sess, current_user.id,
+                                          from_date, to_date)
+            if data_format == "csv":
+                response.set_data(report.to_csv())
+                response.mimetype = "text/csv"
+            else:
+                response.set_data(json.dumps(report.to_json(),
+                                             separators=(",", ":")))
+                response.mimetype = "application/json"
+            return response
+
+        @self.app.route("/api/account/plan")
+        def plan_data():
+            if not current_user.is_authenticated:
+                return jsonify(error="Authorisation required"), 401
+
+            try:
+                targets = tuple(float(request.args[macro]) for macro in MACROS)
+            except (KeyError, ValueError):
+                return jsonify(error="Parameters calories, proteins, fats and "
+                                     "carbonades must be numbers"), 400
+
+            planner = self.get_planner()
+            meals = min(max(request.args.get("meals", 3, type=int), 1),
+                        planner.MAX_MEALS)
+            favorites = request.args.get("favorites", "0") in ("1", "true")
+
+            key = f"plan:{current_user.id}:" \
+                  f"{':'.join(f'{target:g}' for target in targets)}:" \
+                  f"{meals}:{int(favorites)}"
+            user_id = current_user.id
+            try:
+                plan = self.fragments.get_or_set(
+                    key, lambda: self.build_plan(user_id, targets, meals,
+                                                 favorites))
+            except ValueError as error:
+                return jsonify(error=str(error)), 400
+
+            if plan is None:
+                return jsonify(error="Meal catalog is still loading, "
+                                     "try again in a moment"), 503
+            return jsonify(plan)
+
+        @self.app.route("/api/meals/import", methods=["POST"])
+        def import_meals():
+            if not current_user.is_authenticated:
+                return jsonify(error="Authorisation required"), 401
+
+            upload = request.files.get("file")
+            if upload is None:
+                return jsonify(error="File is required"), 400
+
+            data_format = request.form.get("format") or \
+                ("csv" if upload.filename.endswith(".csv") else "jsonl")
+            if data_format not in ("csv", "jsonl"):
+                return jsonify(error="Format must be csv or jsonl"), 400
+
+            images = None
+            if "images" in request.files:
+                try:
+                    images = ImageSource(request.files["images"].stream)
+                except MealImportError as error:
+                    return jsonify(error=str(error)), 400
+
+            importer = MealImporter(db_session.create_session(),
+                                    author=current_user.id, images=images,
+                                    pipeline=self.images)
+
+            def progress():
+                try:
+                    for result in importer.run(
+                            importer.read(upload.stream, data_format)):
+                        for meal_id in result.updated_ids:
+                            self.fragments.invalidate_meal(meal_id)
+                        result.updated_ids.clear()
+                        if result.written:
+                            self.publish_meals(result.written)
+                            result.written.clear()
+                        yield json.dumps(result.to_json()) + "\n"
+                except MealImportError as error:
+                    yield json.dumps({"error": str(error)}) + "\n"
+                finally:
+                    if images is not None:
+                        images.close()
+                    self.fragments.invalidate_feeds()
+
+            return Response(stream_with_context(progress()),
+                            mimetype="application/x-ndjson")
+
+        @self.app.route("/api/meals/export")
+        def export_meals():
+            if not current_user.is_authenticated:
+                return jsonify(error="Authorisation required"), 401
+
+            data_format = request.args.get("format", "jsonl")
+            if data_format not in ("csv", "jsonl"):
+                return jsonify(error="Format must be csv or jsonl"), 400
+
+            exporter = MealExporter(db_session.create_session(),
+                                    author=current_user.id)
+            if data_format == "csv":
+                chunks, mimetype = exporter.csv(), "text/csv"
+            else:
+                chunks, mimetype = exporter.jsonl(), "application/x-ndjson"
+
+            response = Response(stream_with_context(chunks), mimetype=mimetype)
+            response.headers["Content-Disposition"] = \
+                f"attachment; filename=meals.{data_format}"
+            return response
+
+        @self.app.route("/api/status/db")
+        def db_status():
+            if not self.is_internal():
+                return jsonify(error="Status is available only from "
+                                     "internal addresses"), 403
+            return jsonify(pools=db_session.pool_status())
+
+        @self.app.route("/api/status/cache")
+        def cache_status():
+            if not self.is_internal():
+                return jsonify(error="Status is available only from "
+                                     "internal addresses"), 403
+            return jsonify(self.fragments.stats())
 
         @self.app.route("/about")
         def about():
             return render_template("about.html", title="About")
 
+    def is_internal(self):
+        try:
+            address = ipaddress.ip_address(request.remote_addr)
+        except ValueError:
+            return False
+        return any(address in network for network in self.internal_networks)
+
+    @staticmethod
+    def parse_date(value):
+        if value is None:
+            return None
+        return datetime.date.fromisoformat(value)
+
+    @staticmethod
+    def parse_dinner_lines(text, date):
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+
+            name, _, grams = line.partition(";")
+            try:
+                grams = float(grams) if grams.strip() else None
+            except ValueError:
+                raise DinnerLogError(f"Invalid portion in line \"{line}\"")
+            if not is_valid_portion(grams):
+                raise DinnerLogError(f"Invalid portion in line \"{line}\"")
+            items.append((name.strip(), grams, date))
+        return items
+
+    @staticmethod
+    def parse_dinner_items(data):
+        if not isinstance(data, dict) or \
+                not isinstance(data.get("items", []), list):
+            raise DinnerLogError("Expected an object with a list of items")
+
+        try:
+            default_date = App.parse_date(data.get("date"))
+        except (TypeError, ValueError):
+            raise DinnerLogError(f"Invalid date \"{data.get('date')}\"")
+
+        items = []
+        for index, item in enumerate(data.get("items", []), 1):
+            try:
+                name, grams = item["name"], item.get("grams")
+                if not isinstance(name, str):
+                    raise TypeError(name)
+                date = App.parse_date(item.get("date")) or default_date
+            except (AttributeError, KeyError, TypeError, ValueError):
+                raise DinnerLogError(f"Invalid item {index}")
+            try:
+                if isinstance(grams, bool) or \
+                        not isinstance(grams, (int, float, str, type(None))):
+                    raise TypeError(grams)
+                grams = None if grams is None else float(grams)
+            except (TypeError, ValueError):
+                raise DinnerLogError(f"Invalid portion in item {index}")
+            if not is_valid_portion(grams):
+                raise DinnerLogError(f"Invalid portion in item {index}")
+            items.append((name, grams, date))
+        return items
+
+    @staticmethod
+    def render_cards(posts):
+        return render_template("meal_cards.html", posts=posts)
+
+    def get_similar_meals(self):
+        with self.similar_lock:
+            if self.similar_meals is None:
+                from src.similar import SimilarMeals
+                self.similar_meals = SimilarMeals.from_settings(
+                    db_session.load_settings().get("similar_meals", {}),
+                    self.versions)
+        return self.similar_meals
+
+    def publish_meals(self, written):
+        from src.similar import SimilarMeals
+        if self.similar_meals is not None:
+            for meal_id, macros in written:
+                self.similar_meals.update(meal_id, macros)
+        self.versions.bump(SimilarMeals.VERSION_KEY)
+
+    def get_planner(self):
+        with self.similar_lock:
+            if self.planner is None:
+                from src.planner import MealPlanner
+                self.planner = MealPlanner.from_settings(
+                    db_session.load_settings().get("planner", {}))
+        return self.planner
+
+    def build_plan(self, user_id, targets, meals, favorites):
+        planner = self.get_planner()
+        if favorites:
+            db_sess = db_session.create_session()
+            rows = db_sess.execute(
+                sa.select(Post.id, *[getattr(Post, macro) for macro in MACROS])
+                .join(Subscription, Subscription.meal_id == Post.id)
+                .where(Subscription.user_id == user_id)).all()
+            ids = [row[0] for row in rows]
+            macros = [[0 if value is None else value for value in row[1:]]
+                      for row in rows]
+        else:
+            catalog = self.get_similar_meals().catalog(
+                planner.catalog_timeout)
+            if catalog is None:
+                return None
+            ids, macros = catalog
+
+        chosen, portions, nutrition = planner.plan(ids, macros, targets, meals)
+        db_sess = db_session.create_session()
+        names = dict(db_sess.execute(sa.select(Post.id, Post.name)
+                                     .where(Post.id.in_(chosen.tolist()))).all())
+        totals = nutrition.sum(axis=0)
+        return {
+            "targets": dict(zip(MACROS, targets)),
+            "meals": [{"id": meal_id, "name": names.get(meal_id),
+                       "url": f"/meals/{meal_id}", "grams": grams,
+                       **{macro: round(float(value), 1)
+                          for macro, value in zip(MACROS, values)}}
+                      for meal_id, grams, values in zip(
+                          chosen.tolist(), portions.tolist(), nutrition)],
+            "totals": {macro: round(float(total), 1)
+                       for macro, total in zip(MACROS, totals)},
+            "deviation": {macro: round(float(total / target - 1) * 100, 1)
+                          for macro, total, target in zip(MACROS, totals,
+                                                           targets)}
+        }
+
+    def render_similar(self, meal):
+        similar = self.get_similar_meals().similar(
+            meal.id, [getattr(meal, macro) for macro in MACROS])
+        if not similar:
+            return None
+
+        ids = [item["id"] for item in similar]
+        db_sess = db_session.create_session()
+        posts = {post.id: post for post in
+                 db_sess.query(Post).filter(Post.id.in_(ids))}
+        return self.render_cards([posts[meal_id] for meal_id in ids
+                                  if meal_id in posts])
+
+    @staticmethod
+    def load_meal(meal_id):
+        db_sess = db_session.create_session()
+        meal = db_sess.query(Post).options(orm.joinedload(Post.creator)) \
+            .filter(Post.id == meal_id).first()
+        if meal is None:
+            return None
+
+        snapshot = SimpleNamespace(**{column.name: getattr(meal, column.name)
+                                      for column in Post.__table__.columns})
+        snapshot.creator = SimpleNamespace(username=meal.creator.username
+                                           if meal.creator else None)
+        return snapshot
+
+    def preview_url(self, post, size="card", extension="jpg"):
+        return self.assets.url(ImagePipeline.url(post, size, extension))
+
     @staticmethod
-    def build_db_session():
+    def not_modified(etag, last_modified):
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+
+        return last_modified is not None and \
+            request.if_modified_since is not None and \
+            last_modified <= request.if_modified_since
+
+    def build_db_session(self):
         db_session.global_init()
+        if db_session.get_engine().dialect.name == "postgresql":
+            self.partitions = DinnerPartitions.from_settings(
+                db_session.get_engine(),
+                db_session.load_settings().get("dinner_partitions", {}))
+            self.app.before_request(self.partitions.start)
+        self.app.before_request(self.route_reads)
+        self.app.after_request(self.stick_to_primary)
+        self.app.teardown_appcontext(db_session.remove_session)
+
+    @staticmethod
+    def route_reads():
+        if request.method not in ("GET", "HEAD", "OPTIONS") or \
+                request.cookies.get(PRIMARY_COOKIE, 0, type=float) > \
+                time.time():
+            db_session.use_primary()
+
+    @staticmethod
+    def stick_to_primary(response):
+        seconds = db_session.sticky_seconds()
+        if seconds and db_session.has_written():
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + seconds),
+                                max_age=seconds, httponly=True,
+                                samesite="Lax")
+        return response
+
+    def build_instrumentation(self):
+        self.instrumentation = Instrumentation(
+            db_session.load_settings().get("instrumentation"))
+        self.instrumentation.init_app(self.app, db_session.get_engines(),
+                                      self.is_internal)
+        self.instrumentation.add_collector(self.pool_samples)
+        self.instrumentation.add_collector(
+            lambda: {f"mealty_fragment_cache_{COUNTERS.get(name, name)}":
+                     value for name, value in self.fragments.stats().items()})
+
+    @staticmethod
+    def pool_samples():
+        samples = {}
+        for pool in db_session.pool_status():
+            labels = f'role="{pool.pop("role")}"'
+            if "replica" in pool:
+                labels += f',replica="{pool.pop("replica")}"'
+            for name, value in pool.items():
+                samples[f"mealty_db_pool_{COUNTERS.get(name, name)}"
+                        f"{{{labels}}}"] = value
+        return samples
 
     def build_login_manager(self):
         login_manager = LoginManager()
         login_manager.init_app(self.app)
 
+        self.user_cache = UserCache.from_settings(
+            db_session.load_settings().get("user_cache", {}), self.versions)
+
         @login_manager.user_loader
         def load_user(user_id):
-            db_sess = db_session.create_session()
-            return db_sess.query(User).get(user_id)
+            return self.user_cache.get(int(user_id), self.fetch_user)
+
+    @staticmethod
+    def fetch_user(user_id):
+        db_sess = db_session.create_session()
+        return db_sess.get(User, user_id)
 
     def get_app(self):
         return self.app
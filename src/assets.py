@@ -0,0 +1,160 @@
+import os
+import gzip
+import time
+import json
+import hashlib
+import mimetypes
+
+from flask import request, send_from_directory
+
+STATIC_DIRECTORY = "static"
+MANIFEST_PATH = os.path.join(STATIC_DIRECTORY, "manifest.json")
+
+
+class StaticAssets:
+    CACHE_MAX_AGE = 365 * 24 * 60 * 60
+    COMPRESSIBLE = (".css", ".js", ".mjs", ".map", ".svg", ".json", ".txt",
+                    ".html", ".xml", ".ico", ".ttf", ".otf")
+    MIN_COMPRESS_BYTES = 256
+    ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+    SKIP_DIRECTORIES = (os.path.join("image", "graphics"), "json")
+    RELOAD_INTERVAL = 1
+
+    def __init__(self, directory=STATIC_DIRECTORY, manifest_path=MANIFEST_PATH,
+                 fingerprinted=()):
+        self.directory = directory
+        self.manifest_path = manifest_path
+        self.fingerprinted = fingerprinted
+        self.mtime = None
+        self.checked_at = time.monotonic()
+        self.use(self.load())
+
+    def load(self):
+        try:
+            self.mtime = os.stat(self.manifest_path).st_mtime_ns
+            with open(self.manifest_path) as file:
+                return json.load(file)["files"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def use(self, files):
+        self.files = files
+        self.versions = {entry["url"]: name for name, entry in files.items()}
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.RELOAD_INTERVAL:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self.mtime:
+            self.use(self.load() if mtime is not None else {})
+            self.mtime = mtime
+
+    def url(self, path):
+        self.refresh()
+        name = path.removeprefix(f"/{self.directory}/")
+        entry = self.files.get(name)
+        if entry is None:
+            return path
+        return f"/{self.directory}/{entry['url']}"
+
+    def send(self, filename):
+        self.refresh()
+        name = self.versions.get(filename)
+        immutable = name is not None or \
+            any(check(f"/{self.directory}/{filename}")
+                for check in self.fingerprinted)
+        name = name or filename
+        entry = self.files.get(name, {})
+
+        encoding, suffix = self.negotiate(entry.get("encodings", ()))
+        response = send_from_directory(
+            self.directory, name + suffix,
+            mimetype=mimetypes.guess_type(name)[0] or
+            "application/octet-stream",
+            etag=f"{entry['digest']}{suffix}" if entry else True,
+            max_age=self.CACHE_MAX_AGE if immutable else None)
+
+        if encoding:
+            response.content_encoding = encoding
+        if entry.get("encodings"):
+            response.vary.add("Accept-Encoding")
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response
+
+    @staticmethod
+    def negotiate(encodings):
+        for encoding, suffix in StaticAssets.ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                return encoding, suffix
+        return None, ""
+
+    def build(self):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+            print("brotli package is not installed, only gzip variants "
+                  "will be built")
+
+        files = {}
+        for name in self.walk():
+            path = os.path.join(self.directory, name)
+            with open(path, "rb") as file:
+                data = file.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            root, extension = os.path.splitext(name)
+            entry = {"url": f"{root}.{digest}{extension}",
+                     "digest": digest, "encodings": []}
+
+            if extension.lower() in self.COMPRESSIBLE and \
+                    len(data) >= self.MIN_COMPRESS_BYTES:
+                variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+                if brotli is not None:
+                    variants["br"] = brotli.compress(data, quality=11)
+                for encoding, suffix in self.ENCODINGS:
+                    variant = variants.get(encoding)
+                    if variant is not None and len(variant) < len(data):
+                        self.write(path + suffix, variant)
+                        entry["encodings"].append(encoding)
+
+            files[name] = entry
+
+        self.write(self.manifest_path,
+                   json.dumps({"files": files}, indent=2,
+                              sort_keys=True).encode())
+        self.use(files)
+        return files
+
+    def walk(self):
+        for root, directories, names in os.walk(self.directory):
+            relative = os.path.relpath(root, self.directory)
+            directories[:] = sorted(
+                directory for directory in directories
+                if os.path.normpath(os.path.join(relative, directory))
+                not in self.SKIP_DIRECTORIES)
+            for name in sorted(names):
+                path = os.path.normpath(os.path.join(relative, name)) \
+                    .replace(os.sep, "/")
+                if name.endswith((".gz", ".br", ".tmp")) or \
+                        os.path.join(self.directory, path) == \
+                        os.path.normpath(self.manifest_path) or \
+                        any(check(f"/{self.directory}/{path}")
+                            for check in self.fingerprinted):
+                    continue
+                yield path
+
+    @staticmethod
+    def write(path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
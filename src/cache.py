@@ -0,0 +1,139 @@
+import os
+import mmap
+import time
+import zlib
+import fcntl
+import struct
+import threading
+from collections import OrderedDict
+
+VERSIONS_PATH = os.path.join("cache", "versions")
+
+
+class SharedVersions:
+    SLOTS = 65536
+    SLOT = struct.Struct("<Q")
+
+    def __init__(self, path=VERSIONS_PATH, slots=SLOTS):
+        self.path = path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(descriptor).st_size < size:
+                os.ftruncate(descriptor, size)
+            self.memory = mmap.mmap(descriptor, size)
+        finally:
+            os.close(descriptor)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get("path", VERSIONS_PATH),
+                   settings.get("slots", cls.SLOTS))
+
+    def offset(self, key):
+        if not isinstance(key, int):
+            key = zlib.crc32(str(key).encode())
+        return key % self.slots * self.SLOT.size
+
+    def get(self, key):
+        return self.SLOT.unpack_from(self.memory, self.offset(key))[0]
+
+    def bump(self, key):
+        offset = self.offset(key)
+        descriptor = os.open(self.path, os.O_RDWR)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            version = self.SLOT.unpack_from(self.memory, offset)[0]
+            self.SLOT.pack_into(self.memory, offset, (version + 1) % 2 ** 64)
+        finally:
+            os.close(descriptor)
+
+
+class LocalBackend:
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class FragmentCache:
+    def __init__(self, versions, ttl=60, size=1000):
+        self.backend = LocalBackend(ttl, size)
+        self.versions = versions
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, versions):
+        return cls(versions, settings.get("ttl", 60),
+                   settings.get("size", 1000))
+
+    def feed_key(self, *parts):
+        return ":".join(["feed", str(self.versions.get("feed")),
+                         *map(str, parts)])
+
+    def meal_key(self, kind, meal_id):
+        return f"{kind}:{meal_id}:{self.versions.get(f'meal:{meal_id}')}"
+
+    def get_or_set(self, key, producer):
+        value = self.backend.get(key)
+        if value is not None:
+            self.count(hit=True)
+            return value
+
+        self.count(hit=False)
+        value = producer()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def invalidate_meal(self, meal_id):
+        self.versions.bump(f"meal:{meal_id}")
+
+    def invalidate_feeds(self):
+        self.versions.bump("feed")
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.backend.entries),
+                "generation": self.versions.get("feed")
+            }
@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+
+CHART_DIRECTORY = os.path.join("static", "image", "graphics")
+
+
+def render_chart(path, dates, series):
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    calories_ax, macros_ax = fig.subplots(2, 1, sharex=True)
+
+    positions = list(range(len(dates)))
+    calories_ax.bar(positions, series["calories"], color="orange",
+                    label="Calories")
+    calories_ax.set_ylabel("Kcal")
+    calories_ax.set_title("Calories")
+
+    width = 0.25
+    for offset, (name, label) in zip((-width, 0, width),
+                                     (("proteins", "Proteins"),
+                                      ("fats", "Fats"),
+                                      ("carbonades", "Carbonades"))):
+        macros_ax.bar([position + offset for position in positions],
+                      series[name], width, label=label)
+    macros_ax.set_ylabel("Gramms")
+    macros_ax.set_title("Proteins, fats and carbonades")
+    macros_ax.set_xlabel("Date")
+    macros_ax.set_xticks(positions, dates, rotation=45, ha="right")
+    macros_ax.legend()
+
+    fig.tight_layout()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format="png")
+    os.replace(tmp_path, path)
+    return path
+
+
+class ChartRenderer:
+    WORKERS = 2
+    FINGERPRINT = re.compile(r"/\d+/[0-9a-f]{32}\.png$")
+
+    def __init__(self, directory=CHART_DIRECTORY, workers=WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.executor = None
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def chart_path(self, user_id, report):
+        payload = json.dumps({
+            "user": user_id,
+            "dates": report.dates,
+            "series": report.series()
+        }, sort_keys=True)
+        key = hashlib.sha256(payload.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, str(user_id), f"{key}.png")
+
+    def request(self, user_id, report) -> Future:
+        path = self.chart_path(user_id, report)
+
+        with self.lock:
+            if path in self.pending:
+                return self.pending[path]
+
+            if os.path.exists(path):
+                future = Future()
+                future.set_result(path)
+                return future
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            future = self.get_executor().submit(render_chart, path,
+                                                report.dates, report.series())
+            self.pending[path] = future
+
+        future.add_done_callback(lambda _: self.forget(path))
+        return future
+
+    def render(self, user_id, report):
+        future = self.request(user_id, report)
+        if future.done():
+            return future.result(), True
+        return self.chart_path(user_id, report), False
+
+    def invalidate(self, user_id):
+        user_directory = os.path.join(self.directory, str(user_id))
+        if not os.path.isdir(user_directory):
+            return
+
+        with self.lock:
+            in_progress = set(self.pending)
+
+        for name in os.listdir(user_directory):
+            path = os.path.join(user_directory, name)
+            if path not in in_progress:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def is_fingerprinted(cls, path):
+        return cls.FINGERPRINT.search(path) is not None
+
+    def forget(self, path):
+        with self.lock:
+            self.pending.pop(path, None)
+
+    def get_executor(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -0,0 +1,48 @@
+import datetime
+
+import sqlalchemy as sa
+
+from data.models.post import Post
+
+
+class MealFeed:
+    HOME_SIZE = 10
+    PAGE_SIZE = 20
+
+    @staticmethod
+    def ordered(query):
+        return query.order_by(Post.update_date.desc(), Post.id.desc())
+
+    def recent(self, db_sess, limit=HOME_SIZE):
+        return self.ordered(db_sess.query(Post)).limit(limit).all()
+
+    def page(self, db_sess, cursor=None, limit=PAGE_SIZE):
+        query = db_sess.query(Post)
+
+        position = self.decode_cursor(cursor)
+        if position is not None:
+            update_date, post_id = position
+            query = query.filter(sa.tuple_(Post.update_date, Post.id) <
+                                 sa.tuple_(update_date, post_id))
+
+        posts = self.ordered(query).limit(limit + 1).all()
+        if len(posts) <= limit:
+            return posts, None
+
+        posts = posts[:limit]
+        return posts, self.encode_cursor(posts[-1])
+
+    @staticmethod
+    def encode_cursor(post):
+        return f"{post.update_date.isoformat()}_{post.id}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        if not cursor:
+            return None
+
+        try:
+            update_date, post_id = cursor.rsplit("_", 1)
+            return datetime.datetime.fromisoformat(update_date), int(post_id)
+        except ValueError:
+            return None
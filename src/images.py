@@ -0,0 +1,137 @@
+import io
+import os
+import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, \
+    FIRST_COMPLETED
+
+MEALS_DIRECTORY = os.path.join("static", "image", "meals")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImagePipeline:
+    FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+    SIZES = {
+        "card": (576, 576),
+        "detail": (1200, 1200)
+    }
+    MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+    MAX_PIXELS = 40_000_000
+    WORKERS = 2
+    ENCODE_TIMEOUT = 15
+    FINGERPRINT = re.compile(r"/[0-9a-f]{32}-\w+\.\w+$")
+
+    def __init__(self, directory=MEALS_DIRECTORY, workers=WORKERS):
+        self.directory = directory
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="images")
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def process(self, upload, timeout=ENCODE_TIMEOUT):
+        digest = self.finish(self.start(upload), timeout)
+        if digest is None:
+            raise InvalidImage("Preview could not be processed, "
+                               "try again later")
+        return digest
+
+    def start(self, upload):
+        data = upload.read(self.MAX_UPLOAD_BYTES + 1)
+        if len(data) > self.MAX_UPLOAD_BYTES:
+            raise InvalidImage("Preview must be smaller than "
+                               f"{self.MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+        image = self.decode(data)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+
+        with self.lock:
+            if digest not in self.pending and not self.is_ready(digest):
+                os.makedirs(self.directory, exist_ok=True)
+                future = self.executor.submit(self.encode, image, digest)
+                self.pending[digest] = future
+                future.add_done_callback(lambda _: self.forget(digest))
+
+        return digest
+
+    def finish(self, digest, timeout=ENCODE_TIMEOUT):
+        with self.lock:
+            future = self.pending.get(digest)
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except TimeoutError:
+                print(f"Превью {digest} не успело обработаться "
+                      f"за {timeout} с")
+                return None
+            except Exception as error:
+                print(f"Не удалось обработать превью {digest}: {error}")
+                return None
+        return digest if self.is_ready(digest) else None
+
+    def decode(self, data):
+        from PIL import Image, ImageOps
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if image.format not in self.FORMATS:
+                    raise InvalidImage("Preview must be a JPEG, PNG, WebP "
+                                       "or GIF image")
+                if image.width * image.height > self.MAX_PIXELS:
+                    raise InvalidImage("Preview resolution is too large")
+
+                image = ImageOps.exif_transpose(image)
+                return image.convert("RGB")
+        except (OSError, Image.DecompressionBombError, SyntaxError):
+            raise InvalidImage("Preview is not a valid image")
+
+    def encode(self, image, digest):
+        from PIL import Image
+
+        for size, bounds in self.SIZES.items():
+            resized = image.copy()
+            resized.thumbnail(bounds, Image.LANCZOS)
+
+            self.save(resized, self.file_name(digest, size, "webp"),
+                      "WEBP", quality=80, method=4)
+            self.save(resized, self.file_name(digest, size, "jpg"),
+                      "JPEG", quality=82, optimize=True, progressive=True)
+
+    def save(self, image, name, image_format, **options):
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, image_format, **options)
+        os.replace(tmp_path, path)
+
+    def is_ready(self, digest):
+        return os.path.exists(os.path.join(
+            self.directory, self.file_name(digest, "detail", "jpg")))
+
+    def wait_below(self, limit):
+        while True:
+            with self.lock:
+                futures = list(self.pending.values())
+            if len(futures) < limit:
+                return
+            wait(futures, return_when=FIRST_COMPLETED)
+
+    def forget(self, digest):
+        with self.lock:
+            self.pending.pop(digest, None)
+
+    @staticmethod
+    def file_name(digest, size, extension):
+        return f"{digest}-{size}.{extension}"
+
+    @classmethod
+    def is_fingerprinted(cls, path):
+        return cls.FINGERPRINT.search(path) is not None
+
+    @classmethod
+    def url(cls, post, size="card", extension="jpg"):
+        if post.preview is None:
+            return f"/static/image/meals/{post.id}.jpg"
+        return f"/static/image/meals/{cls.file_name(post.preview, size, extension)}"
@@ -0,0 +1,250 @@
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import g, request, has_request_context, Response, \
+    before_render_template, template_rendered
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.6f}"
+    return str(value)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_start = None
+        self.timers = {}
+        self.profiler = None
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.timers = {}
+
+    def add(self, metrics, duration):
+        self.requests += 1
+        self.duration += duration
+        for index, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+        self.queries += metrics.queries
+        self.db_time += metrics.db_time
+        self.template_time += metrics.template_time
+        for name, elapsed in metrics.timers.items():
+            self.timers[name] = self.timers.get(name, 0.0) + elapsed
+
+
+class Instrumentation:
+    DEFAULTS = {
+        "server_timing": False,
+        "profile_sample_rate": 0.0,
+        "slow_request_seconds": 1.0,
+        "profile_directory": "profiles"
+    }
+
+    def __init__(self, settings=None):
+        settings = {**self.DEFAULTS, **(settings or {})}
+        self.server_timing = settings["server_timing"]
+        self.profile_sample_rate = settings["profile_sample_rate"]
+        self.slow_request_seconds = settings["slow_request_seconds"]
+        self.profile_directory = settings["profile_directory"]
+
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.statuses = {}
+        self.collectors = []
+        self.is_allowed = None
+
+    def init_app(self, app, engines, is_allowed=None):
+        self.is_allowed = is_allowed
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+        before_render_template.connect(self.start_template, app)
+        template_rendered.connect(self.finish_template, app)
+
+        for engine in engines:
+            sa.event.listen(engine, "before_cursor_execute", self.start_query)
+            sa.event.listen(engine, "after_cursor_execute", self.finish_query)
+
+    def add_collector(self, collect):
+        self.collectors.append(collect)
+
+    @staticmethod
+    def current():
+        if has_request_context():
+            return g.get("request_metrics")
+        return None
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics = self.current()
+            if metrics is not None:
+                metrics.timers[name] = metrics.timers.get(name, 0.0) + \
+                    time.perf_counter() - start
+
+    def start_request(self):
+        metrics = RequestMetrics()
+        if self.profile_sample_rate and \
+                random.random() < self.profile_sample_rate:
+            import cProfile
+            metrics.profiler = cProfile.Profile()
+            metrics.profiler.enable()
+        g.request_metrics = metrics
+
+    def finish_request(self, response):
+        metrics = self.current()
+        if metrics is None:
+            return response
+
+        duration = time.perf_counter() - metrics.start
+        if metrics.profiler is not None:
+            metrics.profiler.disable()
+            if duration >= self.slow_request_seconds:
+                self.dump_profile(metrics.profiler, duration)
+
+        endpoint = request.endpoint or "unknown"
+        with self.lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()) \
+                .add(metrics, duration)
+            key = (endpoint, request.method, response.status_code)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+        if self.server_timing:
+            response.headers["Server-Timing"] = \
+                self.server_timing_header(metrics, duration)
+        return response
+
+    def start_template(self, sender, template, context, **extra):
+        metrics = self.current()
+        if metrics is not None:
+            metrics.template_start = time.perf_counter()
+
+    def finish_template(self, sender, template, context, **extra):
+        metrics = self.current()
+        if metrics is not None and metrics.template_start is not None:
+            metrics.template_time += time.perf_counter() - \
+                metrics.template_start
+            metrics.template_start = None
+
+    def start_query(self, conn, cursor, statement, parameters, context,
+                    executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def finish_query(self, conn, cursor, statement, parameters, context,
+                     executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        metrics = self.current()
+        if metrics is not None:
+            metrics.queries += 1
+            metrics.db_time += elapsed
+
+    @staticmethod
+    def server_timing_header(metrics, duration):
+        entries = [
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f"tpl;dur={metrics.template_time * 1000:.2f}"
+        ]
+        entries += [f"{name};dur={elapsed * 1000:.2f}"
+                    for name, elapsed in metrics.timers.items()]
+        entries.append(f"total;dur={duration * 1000:.2f}")
+        return ", ".join(entries)
+
+    def dump_profile(self, profiler, duration):
+        os.makedirs(self.profile_directory, exist_ok=True)
+        name = f"{int(time.time())}-{os.getpid()}-" \
+               f"{(request.endpoint or 'unknown')}-{duration * 1000:.0f}ms.prof"
+        profiler.dump_stats(os.path.join(self.profile_directory, name))
+
+    def metrics_view(self):
+        if self.is_allowed is not None and not self.is_allowed():
+            return Response("Metrics are available only from internal "
+                            "addresses\n", status=403, mimetype="text/plain")
+        return Response(self.render_metrics(),
+                        mimetype="text/plain; version=0.0.4")
+
+    def render_metrics(self):
+        lines = []
+
+        def family(name, metric_type, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        with self.lock:
+            endpoints = dict(self.endpoints)
+            statuses = dict(self.statuses)
+
+            family("mealty_requests_total", "counter",
+                   "Finished requests by endpoint, method and status")
+            for (endpoint, method, status), count in sorted(statuses.items()):
+                lines.append(f'mealty_requests_total{{endpoint="{endpoint}",'
+                             f'method="{method}",status="{status}"}} {count}')
+
+            family("mealty_request_duration_seconds", "histogram",
+                   "Request duration by endpoint")
+            for endpoint, stats in sorted(endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    lines.append(f'mealty_request_duration_seconds_bucket'
+                                 f'{{{label},le="{bound}"}} {count}')
+                lines.append(f'mealty_request_duration_seconds_bucket'
+                             f'{{{label},le="+Inf"}} {stats.requests}')
+                lines.append(f"mealty_request_duration_seconds_sum"
+                             f"{{{label}}} {stats.duration:.6f}")
+                lines.append(f"mealty_request_duration_seconds_count"
+                             f"{{{label}}} {stats.requests}")
+
+            for name, attribute, help_text in (
+                    ("mealty_sql_queries_total", "queries",
+                     "SQL statements executed by endpoint"),
+                    ("mealty_db_seconds_total", "db_time",
+                     "Time spent in SQL statements by endpoint"),
+                    ("mealty_template_seconds_total", "template_time",
+                     "Time spent rendering templates by endpoint")):
+                family(name, "counter", help_text)
+                for endpoint, stats in sorted(endpoints.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} '
+                                 f'{format_value(getattr(stats, attribute))}')
+
+            family("mealty_timer_seconds_total", "counter",
+                   "Time spent in named sections such as chart rendering")
+            for endpoint, stats in sorted(endpoints.items()):
+                for timer, value in sorted(stats.timers.items()):
+                    lines.append(f'mealty_timer_seconds_total{{endpoint='
+                                 f'"{endpoint}",timer="{timer}"}} '
+                                 f'{value:.6f}')
+
+        samples = {}
+        for collect in self.collectors:
+            for name, value in collect().items():
+                samples.setdefault(name.split("{", 1)[0], []) \
+                    .append((name, value))
+        for base, values in samples.items():
+            family(base, "counter" if base.endswith("_total") else "gauge",
+                   base.replace("_", " "))
+            lines.extend(f"{name} {format_value(value)}"
+                         for name, value in values)
+
+        return "\n".join(lines) + "\n"
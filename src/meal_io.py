@@ -0,0 +1,252 @@
+import io
+import os
+import csv
+import json
+import zipfile
+import datetime
+
+import sqlalchemy as sa
+
+from data import db_session
+from data.models.post import Post
+from src.images import InvalidImage
+from src.nutrition import NutritionRollup, MACROS
+
+FIELDS = ("external_id", "name", *MACROS, "about")
+EXPORT_FIELDS = ("id", *FIELDS, "author", "preview", "update_date")
+
+
+class MealImportError(ValueError):
+    pass
+
+
+class ImageSource:
+    def __init__(self, path):
+        self.archive = None
+        self.directory = None
+        if zipfile.is_zipfile(path):
+            self.archive = zipfile.ZipFile(path)
+        elif isinstance(path, str) and os.path.isdir(path):
+            self.directory = path
+        else:
+            raise MealImportError("Images must be a directory or "
+                                  "a zip archive")
+
+    def open(self, name):
+        if self.archive is not None:
+            return self.archive.open(name)
+
+        full_path = os.path.realpath(os.path.join(self.directory, name))
+        if not full_path.startswith(os.path.realpath(self.directory) + os.sep):
+            raise FileNotFoundError(name)
+        return open(full_path, "rb")
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+        self.updated_ids = []
+        self.written = []
+
+    def to_json(self):
+        return {
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "errors": self.errors[:100],
+            "error_count": len(self.errors)
+        }
+
+
+class MealImporter:
+    BATCH_SIZE = 1000
+    MAX_PENDING_IMAGES = 8
+
+    def __init__(self, db_sess, author=None, images=None, pipeline=None,
+                 batch_size=BATCH_SIZE):
+        self.db_sess = db_sess
+        self.author = author
+        self.images = images
+        self.pipeline = pipeline
+        self.batch_size = batch_size
+
+    @staticmethod
+    def read(stream, data_format):
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        if data_format == "csv":
+            for line, record in enumerate(csv.DictReader(text), start=2):
+                yield line, record
+        elif data_format == "jsonl":
+            for line, row in enumerate(text, start=1):
+                if not row.strip():
+                    continue
+                try:
+                    yield line, json.loads(row)
+                except json.JSONDecodeError as error:
+                    yield line, error
+        else:
+            raise MealImportError(f"Unknown import format {data_format}")
+
+    def run(self, records):
+        result = ImportResult()
+        batch = []
+        for line, record in records:
+            result.processed += 1
+            try:
+                batch.append((line, self.normalize(record)))
+            except (MealImportError, InvalidImage, FileNotFoundError,
+                    KeyError) as error:
+                result.errors.append({"line": line, "error": str(error)})
+
+            if len(batch) >= self.batch_size:
+                self.flush(batch, result)
+                batch = []
+                yield result
+
+        if batch:
+            self.flush(batch, result)
+        yield result
+
+    def normalize(self, record):
+        if isinstance(record, Exception):
+            raise MealImportError(f"Invalid JSON: {record}")
+        if not isinstance(record, dict):
+            raise MealImportError("Expected a JSON object")
+
+        if not record.get("name"):
+            raise MealImportError("Meal name is required")
+
+        row = {
+            "external_id": record.get("external_id") or None,
+            "name": record["name"],
+            "about": record.get("about") or None,
+            "author": self.author,
+            "preview": None,
+            "update_date": datetime.datetime.now()
+        }
+        for macro in MACROS:
+            try:
+                row[macro] = float(record.get(macro) or 0)
+            except (TypeError, ValueError):
+                raise MealImportError(f"{macro} must be a number")
+
+        if record.get("image") and self.images is not None:
+            with self.images.open(record["image"]) as image:
+                row["preview"] = self.pipeline.start(image)
+            self.pipeline.wait_below(self.MAX_PENDING_IMAGES)
+
+        return row
+
+    def flush(self, batch, result):
+        keyed = {}
+        plain = []
+        for line, row in batch:
+            if row["preview"] is not None:
+                row["preview"] = self.pipeline.finish(row["preview"])
+            if row["external_id"] is None:
+                plain.append(row)
+            else:
+                keyed[row["external_id"]] = line, row
+
+        if plain:
+            result.written.extend(
+                (row[0], row[1:]) for row in self.db_sess.execute(
+                    sa.insert(Post).returning(Post.id, *[
+                        getattr(Post, macro) for macro in MACROS]), plain))
+            result.inserted += len(plain)
+
+        if keyed:
+            self.upsert(keyed, result)
+
+        self.db_sess.commit()
+
+    def upsert(self, keyed, result):
+        existing = {
+            row.external_id: row for row in self.db_sess.execute(
+                sa.select(Post.id, Post.external_id, Post.author, *[
+                    getattr(Post, macro) for macro in MACROS])
+                .where(Post.external_id.in_(keyed)))
+        }
+
+        statement = db_session.insert(self.db_sess, Post)
+        updated = {column: getattr(statement.excluded, column)
+                   for column in ("name", "about", "update_date", *MACROS)}
+        updated["preview"] = sa.func.coalesce(statement.excluded.preview,
+                                              Post.preview)
+        owned = None
+        if self.author is not None:
+            owned = Post.author == statement.excluded.author
+        written = {
+            row[1]: row for row in self.db_sess.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[Post.external_id], set_=updated,
+                    where=owned)
+                .returning(Post.id, Post.external_id, *[
+                    getattr(Post, macro) for macro in MACROS]),
+                [row for line, row in keyed.values()])
+        }
+
+        for external_id, (line, row) in keyed.items():
+            old = existing.get(external_id)
+            if external_id not in written:
+                result.errors.append({
+                    "line": line,
+                    "error": f"external_id {external_id} belongs to a meal "
+                             f"of another user"})
+                continue
+            result.written.append((written[external_id][0],
+                                   written[external_id][2:]))
+            if old is None:
+                result.inserted += 1
+                continue
+
+            result.updated += 1
+            result.updated_ids.append(old.id)
+            NutritionRollup.change_meal(
+                self.db_sess, old.id,
+                {macro: getattr(old, macro) for macro in MACROS},
+                {macro: row[macro] for macro in MACROS})
+
+
+class MealExporter:
+    BATCH_SIZE = 1000
+
+    def __init__(self, db_sess, author=None, batch_size=BATCH_SIZE):
+        self.db_sess = db_sess
+        self.author = author
+        self.batch_size = batch_size
+
+    def rows(self):
+        query = sa.select(*[getattr(Post, field) for field in EXPORT_FIELDS]) \
+            .order_by(Post.id) \
+            .execution_options(yield_per=self.batch_size)
+        if self.author is not None:
+            query = query.where(Post.author == self.author)
+        for row in self.db_sess.execute(query):
+            data = row._asdict()
+            if data["update_date"] is not None:
+                data["update_date"] = data["update_date"].isoformat()
+            yield data
+
+    def jsonl(self):
+        for data in self.rows():
+            yield json.dumps(data, ensure_ascii=False) + "\n"
+
+    def csv(self):
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for data in self.rows():
+            writer.writerow(data)
+            if output.tell() >= 64 * 1024:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
@@ -0,0 +1,217 @@
+import io
+import csv
+import math
+import datetime
+
+import sqlalchemy as sa
+
+from data import db_session
+from data.models.daily_nutrition import DailyNutrition
+from data.models.dinner import Dinner
+from data.models.post import Post
+
+MACROS = ("calories", "proteins", "fats", "carbonades")
+DEFAULT_GRAMS = 100
+
+
+def portion(grams):
+    return (DEFAULT_GRAMS if grams is None else grams) / 100
+
+
+def is_valid_portion(grams):
+    return grams is None or (math.isfinite(grams) and grams > 0)
+
+
+class DinnerLogError(ValueError):
+    pass
+
+
+class NutritionReport:
+    def __init__(self, rows):
+        self.dates = [str(row.date) for row in rows]
+        self.calories = [row.calories for row in rows]
+        self.proteins = [row.proteins for row in rows]
+        self.fats = [row.fats for row in rows]
+        self.carbonades = [row.carbonades for row in rows]
+
+    def series(self):
+        return {macro: getattr(self, macro) for macro in MACROS}
+
+    @classmethod
+    def load(cls, db_sess, user_id, from_date, to_date):
+        rows = db_sess.query(DailyNutrition) \
+            .filter(DailyNutrition.user_id == user_id,
+                    DailyNutrition.date >= from_date,
+                    DailyNutrition.date <= to_date) \
+            .order_by(DailyNutrition.date).all()
+
+        return cls(rows)
+
+    @staticmethod
+    def version(db_sess, user_id, from_date, to_date):
+        return db_sess.query(
+            sa.func.count(),
+            sa.func.max(DailyNutrition.update_date)
+        ).filter(DailyNutrition.user_id == user_id,
+                 DailyNutrition.date >= from_date,
+                 DailyNutrition.date <= to_date).one()
+
+    def to_json(self):
+        return {"dates": self.dates, **self.series()}
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["date", *MACROS])
+        writer.writerows(zip(self.dates, *self.series().values()))
+        return output.getvalue()
+
+
+class NutritionRollup:
+    @staticmethod
+    def add_dinner(db_sess, dinner, meal):
+        NutritionRollup.add_dinners(db_sess, [(dinner, meal)])
+
+    @staticmethod
+    def add_dinners(db_sess, dinners):
+        totals = {}
+        for dinner, meal in dinners:
+            key = (dinner.user_id, dinner.date)
+            row = totals.setdefault(key, {
+                "user_id": dinner.user_id,
+                "date": dinner.date,
+                "dinner_count": 0,
+                "update_date": datetime.datetime.now(),
+                **{macro: 0.0 for macro in MACROS}
+            })
+            row["dinner_count"] += 1
+            for macro in MACROS:
+                row[macro] += (getattr(meal, macro) or 0) * \
+                    portion(dinner.grams)
+
+        if not totals:
+            return
+
+        statement = db_session.insert(db_sess, DailyNutrition)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[DailyNutrition.user_id, DailyNutrition.date],
+            set_={
+                **{macro: getattr(DailyNutrition, macro) +
+                   getattr(excluded, macro) for macro in MACROS},
+                "dinner_count": DailyNutrition.dinner_count +
+                excluded.dinner_count,
+                "update_date": excluded.update_date
+            }
+        )
+        db_sess.execute(statement, list(totals.values()))
+
+    @staticmethod
+    def change_meal(db_sess, meal_id, old_values, new_values):
+        delta = {macro: (new_values[macro] or 0) - (old_values[macro] or 0)
+                 for macro in MACROS}
+        if not any(delta.values()):
+            return
+
+        portions = sa.select(
+            Dinner.user_id, Dinner.date,
+            (sa.func.sum(Dinner.grams) / 100).label("portions")
+        ).where(Dinner.meal_id == meal_id) \
+            .group_by(Dinner.user_id, Dinner.date).subquery()
+
+        statement = sa.update(DailyNutrition).where(
+            DailyNutrition.user_id == portions.c.user_id,
+            DailyNutrition.date == portions.c.date
+        ).values(
+            update_date=datetime.datetime.now(),
+            **{macro: getattr(DailyNutrition, macro) +
+               delta[macro] * portions.c.portions for macro in MACROS}
+        )
+        db_sess.execute(statement)
+
+    @staticmethod
+    def totals(user_id=None, from_date=None, to_date=None):
+        totals = sa.select(
+            Dinner.user_id, Dinner.date,
+            *[sa.func.coalesce(sa.func.sum(
+                getattr(Post, macro) * Dinner.grams / 100), 0)
+              for macro in MACROS],
+            sa.func.count(),
+            sa.func.now()
+        ).join(Post, Post.id == Dinner.meal_id) \
+            .group_by(Dinner.user_id, Dinner.date)
+
+        if user_id is not None:
+            totals = totals.where(Dinner.user_id == user_id)
+        if from_date is not None:
+            totals = totals.where(Dinner.date >= from_date)
+        if to_date is not None:
+            totals = totals.where(Dinner.date <= to_date)
+        return totals
+
+    @staticmethod
+    def rebuild(db_sess, user_id=None, from_date=None, to_date=None):
+        delete = sa.delete(DailyNutrition)
+        if user_id is not None:
+            delete = delete.where(DailyNutrition.user_id == user_id)
+        if from_date is not None:
+            delete = delete.where(DailyNutrition.date >= from_date)
+        if to_date is not None:
+            delete = delete.where(DailyNutrition.date <= to_date)
+
+        db_sess.execute(delete)
+        result = db_sess.execute(sa.insert(DailyNutrition).from_select(
+            ["user_id", "date", *MACROS, "dinner_count", "update_date"],
+            NutritionRollup.totals(user_id, from_date, to_date)))
+        return result.rowcount
+
+
+class DinnerLog:
+    MAX_ITEMS = 200
+
+    def __init__(self, db_sess, user_id):
+        self.db_sess = db_sess
+        self.user_id = user_id
+
+    def log(self, items):
+        if not items:
+            raise DinnerLogError("Nothing to log")
+        if len(items) > self.MAX_ITEMS:
+            raise DinnerLogError(f"At most {self.MAX_ITEMS} items can be "
+                                 "logged at once")
+
+        meals = self.find_meals({name for name, grams, date in items})
+        missing = sorted({name for name, grams, date in items
+                          if name not in meals})
+        if missing:
+            raise DinnerLogError("No meal found with such name: " +
+                                 ", ".join(missing))
+
+        dinners = []
+        for name, grams, date in items:
+            if not is_valid_portion(grams):
+                raise DinnerLogError(f"Portion of {name} must be a positive "
+                                     "number")
+
+            dinners.append(Dinner(
+                user_id=self.user_id,
+                meal_id=meals[name].id,
+                grams=DEFAULT_GRAMS if grams is None else grams,
+                date=date or datetime.date.today()
+            ))
+
+        self.db_sess.add_all(dinners)
+        NutritionRollup.add_dinners(
+            self.db_sess, [(dinner, meals[name])
+                           for dinner, (name, grams, date)
+                           in zip(dinners, items)])
+        return dinners
+
+    def find_meals(self, names):
+        meals = {}
+        for meal in self.db_sess.query(Post) \
+                .filter(Post.name.in_(names)) \
+                .order_by(Post.id) \
+                .with_for_update(read=True):
+            meals.setdefault(meal.name, meal)
+        return meals
@@ -0,0 +1,227 @@
+import os
+import re
+import csv
+import gzip
+import json
+import time
+import threading
+import contextlib
+import datetime
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from src.nutrition import NutritionRollup
+
+ARCHIVE_DIRECTORY = os.path.join("archive", "dinners")
+
+
+class PartitionError(RuntimeError):
+    pass
+
+
+class DinnerPartitions:
+    TABLE = "dinners"
+    DEFAULT_PARTITION = "dinners_default"
+    COLUMNS = ("id", "user_id", "meal_id", "date", "grams")
+    MONTHS_AHEAD = 3
+    ENSURE_INTERVAL = 3600
+    EXPORT_BATCH = 10000
+    LOCK_KEY = 2024100501
+    LOCK_TIMEOUT = "10s"
+    NAME = re.compile(r"^dinners_y(\d{4})m(\d{2})$")
+
+    def __init__(self, engine, months_ahead=MONTHS_AHEAD,
+                 retention_months=None, archive_directory=ARCHIVE_DIRECTORY,
+                 keep_detached=False, ensure_interval=ENSURE_INTERVAL):
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_directory = archive_directory
+        self.keep_detached = keep_detached
+        self.ensure_interval = ensure_interval
+        self.thread = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, engine, settings):
+        return cls(engine, settings.get("months_ahead", cls.MONTHS_AHEAD),
+                   settings.get("retention_months"),
+                   settings.get("archive_directory", ARCHIVE_DIRECTORY),
+                   settings.get("keep_detached", False),
+                   settings.get("ensure_interval", cls.ENSURE_INTERVAL))
+
+    @staticmethod
+    def add_months(month, count):
+        index = month.year * 12 + month.month - 1 + count
+        return datetime.date(index // 12, index % 12 + 1, 1)
+
+    @staticmethod
+    def name(month):
+        return f"dinners_y{month.year}m{month.month:02d}"
+
+    def check(self, connection):
+        if connection.dialect.name != "postgresql":
+            raise PartitionError("Partitioning of dinners needs PostgreSQL")
+        partitioned = connection.execute(sa.text(
+            "SELECT relkind = 'p' FROM pg_class "
+            "WHERE oid = to_regclass(:table)"), {"table": self.TABLE}).scalar()
+        if not partitioned:
+            raise PartitionError("dinners is not partitioned, run "
+                                 "python3 manage.py db upgrade")
+
+    def months(self, connection):
+        names = connection.execute(sa.text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"),
+            {"table": self.TABLE}).scalars()
+        return sorted(datetime.date(int(match.group(1)),
+                                    int(match.group(2)), 1)
+                      for match in map(self.NAME.match, names) if match)
+
+    def describe(self):
+        with self.engine.connect() as connection:
+            self.check(connection)
+            sizes = dict(connection.execute(sa.text(
+                "SELECT child.relname, pg_total_relation_size(child.oid) "
+                "FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = to_regclass(:table)"),
+                {"table": self.TABLE}).all())
+            return [(self.name(month), month, sizes[self.name(month)])
+                    for month in self.months(connection)] + \
+                [(self.DEFAULT_PARTITION, None,
+                  sizes.get(self.DEFAULT_PARTITION, 0))]
+
+    def ensure(self, today=None):
+        current = (today or datetime.date.today()).replace(day=1)
+        created = []
+        with self.transaction() as connection:
+            connection.execute(sa.text("SELECT pg_advisory_xact_lock(:key)"),
+                               {"key": self.LOCK_KEY})
+            existing = set(self.months(connection))
+            for offset in range(self.months_ahead + 1):
+                month = self.add_months(current, offset)
+                if month not in existing:
+                    created.append((self.name(month),
+                                    self.create(connection, month)))
+        return created
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.maintain,
+                                               name="dinner-partitions",
+                                               daemon=True)
+                self.thread.start()
+
+    def maintain(self):
+        while True:
+            try:
+                for name, moved in self.ensure():
+                    print(f"Создана секция {name}, перенесено строк "
+                          f"из {self.DEFAULT_PARTITION}: {moved}")
+            except (PartitionError, sa.exc.SQLAlchemyError) as error:
+                print(f"Не удалось создать секции ужинов: {error}")
+            time.sleep(self.ensure_interval)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        try:
+            with self.engine.begin() as connection:
+                self.check(connection)
+                connection.execute(sa.text(
+                    f"SET LOCAL lock_timeout = '{self.LOCK_TIMEOUT}'"))
+                yield connection
+        except sa.exc.OperationalError as error:
+            raise PartitionError(f"Partition maintenance failed, "
+                                 f"try again later: {error.orig}")
+
+    def create(self, connection, month):
+        name, start, end = self.name(month), month, self.add_months(month, 1)
+        connection.execute(sa.text(
+            f"CREATE TABLE {name} (LIKE {self.TABLE} INCLUDING DEFAULTS)"))
+        moved = connection.execute(sa.text(
+            f"WITH moved AS (DELETE FROM {self.DEFAULT_PARTITION} "
+            f"WHERE date >= :start AND date < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"),
+            {"start": start, "end": end}).rowcount
+        connection.execute(sa.text(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+            f"CHECK (date >= '{start}' AND date < '{end}')"))
+        connection.execute(sa.text(
+            f"ALTER TABLE {self.TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"))
+        connection.execute(sa.text(
+            f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+        return moved
+
+    def archive(self, retention_months=None, today=None):
+        retention_months = retention_months or self.retention_months
+        if not retention_months:
+            raise PartitionError("Retention is not configured, set "
+                                 "dinner_partitions.retention_months")
+
+        before = self.add_months((today or datetime.date.today())
+                                 .replace(day=1), -retention_months)
+        with self.engine.connect() as connection:
+            self.check(connection)
+            months = [month for month in self.months(connection)
+                      if month < before]
+
+        archived = []
+        for month in months:
+            with self.transaction() as connection:
+                archived.append(self.archive_partition(connection, month))
+        return archived
+
+    def archive_partition(self, connection, month):
+        name = self.name(month)
+        connection.execute(sa.text(f"LOCK TABLE {name} IN SHARE MODE"))
+
+        os.makedirs(self.archive_directory, exist_ok=True)
+        path = os.path.join(self.archive_directory, f"{name}.csv.gz")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        rows = 0
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(self.COLUMNS)
+            result = connection.execute(
+                sa.text(f"SELECT {', '.join(self.COLUMNS)} FROM {name} "
+                        f"ORDER BY id")
+                .execution_options(yield_per=self.EXPORT_BATCH))
+            for partition in result.partitions():
+                writer.writerows(partition)
+                rows += len(partition)
+        with open(tmp_path, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+        connection.execute(sa.text(
+            f"ALTER TABLE {self.TABLE} DETACH PARTITION {name}"))
+        if not self.keep_detached:
+            connection.execute(sa.text(f"DROP TABLE {name}"))
+        return name, rows, path
+
+    def explain(self, user_id, from_date, to_date):
+        statement = NutritionRollup.totals(user_id, from_date, to_date)
+        sql = statement.compile(dialect=postgresql.dialect(),
+                                compile_kwargs={"literal_binds": True})
+        with self.engine.connect() as connection:
+            self.check(connection)
+            plan = connection.execute(
+                sa.text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            total = len(self.months(connection)) + 1
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scanned = sorted(set(self.relations(plan[0]["Plan"])) -
+                         {"posts", self.TABLE})
+        return scanned, total
+
+    def relations(self, node):
+        if "Relation Name" in node:
+            yield node["Relation Name"]
+        for child in node.get("Plans", []):
+            yield from self.relations(child)
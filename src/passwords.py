@@ -0,0 +1,95 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
+class PasswordHasher:
+    DEFAULTS = {
+        "method": "scrypt:32768:8:1",
+        "salt_length": 16,
+        "workers": 2,
+        "max_pending": 64,
+        "timeout": 10
+    }
+
+    def __init__(self, method, salt_length, workers, max_pending, timeout):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.executor = None
+        self.prefix = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        settings = {**cls.DEFAULTS, **(settings or {})}
+        return cls(settings["method"], int(settings["salt_length"]),
+                   int(settings["workers"]), int(settings["max_pending"]),
+                   float(settings["timeout"]))
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method,
+                        self.salt_length)
+
+    def verify(self, hashed_password, password):
+        if not hashed_password:
+            return False
+        return self.run(check_password_hash, hashed_password, password)
+
+    def needs_rehash(self, hashed_password):
+        if self.prefix is None:
+            self.prefix = self.run(generate_password_hash, "", self.method,
+                                   1).split("$", 1)[0]
+        return hashed_password.split("$", 1)[0] != self.prefix
+
+    def run(self, function, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy("Too many password checks in progress")
+        executor = self.get_executor()
+        try:
+            future = executor.submit(function, *args)
+        except BrokenProcessPool:
+            self.slots.release()
+            self.reset(executor)
+            raise PasswordHasherBusy("Password workers are restarting")
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy("Password check took too long")
+        except BrokenProcessPool:
+            self.reset(executor)
+            raise PasswordHasherBusy("Password workers are restarting")
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+            return self.executor
+
+    def reset(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
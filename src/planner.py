@@ -0,0 +1,116 @@
+import math
+import itertools
+
+import numpy as np
+
+from src.nutrition import MACROS
+
+DIMENSIONS = len(MACROS)
+
+
+class PlanError(ValueError):
+    pass
+
+
+class MealPlanner:
+    BATCH = 4096
+    ITERATIONS = 120
+    ELITES = 64
+    MIN_GRAMS = 30
+    MAX_GRAMS = 600
+    GRAMS_STEP = 5
+    MAX_MEALS = 6
+    WEIGHTS = (2.0, 1.0, 1.0, 1.0)
+    CATALOG_TIMEOUT = 5
+
+    def __init__(self, batch=BATCH, iterations=ITERATIONS,
+                 catalog_timeout=CATALOG_TIMEOUT):
+        self.batch = batch
+        self.iterations = iterations
+        self.catalog_timeout = catalog_timeout
+        self.weights = np.sqrt(np.array(self.WEIGHTS))
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get("batch", cls.BATCH),
+                   settings.get("iterations", cls.ITERATIONS),
+                   settings.get("catalog_timeout", cls.CATALOG_TIMEOUT))
+
+    def plan(self, ids, macros, targets, meals, seed=0):
+        ids = np.asarray(ids, dtype=np.int64)
+        per_gram = np.nan_to_num(np.asarray(macros, dtype=np.float64)
+                                 .reshape(-1, DIMENSIONS)) / 100
+        targets = np.asarray(targets, dtype=np.float64)
+        if len(ids) == 0:
+            raise PlanError("There are no meals to plan from")
+        if not (np.isfinite(targets) & (targets > 0)).all():
+            raise PlanError("Targets must be positive numbers")
+
+        meals = min(meals, len(ids))
+        generator = np.random.default_rng(seed)
+        scaled = per_gram / targets * self.weights
+
+        subsets = self.sample(generator, len(ids), meals, self.batch)
+        grams, losses = self.fit(scaled[subsets])
+        if math.comb(len(ids), meals) > self.batch:
+            subsets, grams, losses = self.refine(generator, scaled, subsets,
+                                                 losses)
+
+        best = int(np.argmin(losses))
+        chosen = subsets[best]
+        portions = np.clip(np.round(grams[best] / self.GRAMS_STEP) *
+                           self.GRAMS_STEP, self.MIN_GRAMS, self.MAX_GRAMS)
+        return ids[chosen], portions, per_gram[chosen] * portions[:, None]
+
+    def sample(self, generator, size, meals, count):
+        if math.comb(size, meals) <= count:
+            return np.array(list(itertools.combinations(range(size), meals)),
+                            dtype=np.int64)
+
+        subsets = generator.integers(0, size, (count, meals))
+        repeated = ~self.distinct(subsets)
+        while repeated.any():
+            subsets[repeated] = generator.integers(
+                0, size, (int(repeated.sum()), meals))
+            repeated = ~self.distinct(subsets)
+        return subsets
+
+    def refine(self, generator, scaled, subsets, losses):
+        elites = subsets[np.argsort(losses)[:self.ELITES]]
+        variants = np.repeat(elites, self.batch // len(elites), axis=0)
+        positions = generator.integers(0, variants.shape[1], len(variants))
+        variants[np.arange(len(variants)), positions] = \
+            generator.integers(0, len(scaled), len(variants))
+
+        subsets = np.concatenate([elites, variants[self.distinct(variants)]])
+        return (subsets, *self.fit(scaled[subsets]))
+
+    @staticmethod
+    def distinct(subsets):
+        ordered = np.sort(subsets, axis=1)
+        return (ordered[:, 1:] != ordered[:, :-1]).all(axis=1)
+
+    def fit(self, scaled):
+        count, meals, _ = scaled.shape
+        ideal = self.weights
+
+        calories = scaled[:, :, 0].sum(axis=1, keepdims=True)
+        grams = np.clip(np.broadcast_to(
+            ideal[0] / np.maximum(calories, 1e-9), (count, meals)),
+            self.MIN_GRAMS, self.MAX_GRAMS)
+        step = 1 / (2 * (scaled ** 2).sum(axis=(1, 2)) + 1e-12)[:, None]
+
+        momentum, previous, acceleration = grams, grams, 1.0
+        for _ in range(self.iterations):
+            residual = np.einsum("bm,bmj->bj", momentum, scaled) - ideal
+            gradient = 2 * np.einsum("bj,bmj->bm", residual, scaled)
+            grams = np.clip(momentum - step * gradient,
+                            self.MIN_GRAMS, self.MAX_GRAMS)
+
+            next_acceleration = (1 + math.sqrt(1 + 4 * acceleration ** 2)) / 2
+            momentum = grams + (acceleration - 1) / next_acceleration * \
+                (grams - previous)
+            previous, acceleration = grams, next_acceleration
+
+        residual = np.einsum("bm,bmj->bj", grams, scaled) - ideal
+        return grams, (residual ** 2).sum(axis=1)
@@ -0,0 +1,73 @@
+import re
+
+import sqlalchemy as sa
+
+from data.models.post import Post, SEARCH_CONFIG, search_document
+
+
+class MealSearch:
+    PAGE_SIZE = 20
+    SUGGEST_SIZE = 10
+
+    def search(self, db_sess, text, page=1, limit=PAGE_SIZE):
+        query = db_sess.query(Post)
+        if self.is_postgresql(db_sess):
+            query = self.ranked(query, text)
+        else:
+            query = query.filter(Post.name.ilike(f"%{self.escape(text)}%",
+                                                 escape="\\")) \
+                .order_by(Post.name, Post.id)
+
+        posts = query.offset((page - 1) * limit).limit(limit + 1).all()
+        return posts[:limit], len(posts) > limit
+
+    def autocomplete(self, db_sess, prefix, limit=SUGGEST_SIZE):
+        pattern = f"{self.escape(prefix)}%"
+        query = db_sess.query(Post.name).filter(
+            Post.name.ilike(pattern, escape="\\"))
+
+        if self.is_postgresql(db_sess):
+            query = query.order_by(sa.func.similarity(Post.name, prefix).desc(),
+                                   Post.name)
+        else:
+            query = query.order_by(Post.name)
+
+        return [name for name, in query.distinct().limit(limit).all()]
+
+    def suggest(self, db_sess, text, limit=SUGGEST_SIZE):
+        if not self.is_postgresql(db_sess):
+            return self.autocomplete(db_sess, text, limit)
+
+        similarity = sa.func.similarity(Post.name, text)
+        query = db_sess.query(Post.name).filter(Post.name.op("%")(text)) \
+            .group_by(Post.name).order_by(sa.func.max(similarity).desc())
+        return [name for name, in query.limit(limit).all()]
+
+    def ranked(self, query, text):
+        document = search_document(Post.name, Post.about)
+        terms = self.terms(text)
+
+        if terms:
+            ts_query = sa.func.to_tsquery(SEARCH_CONFIG, terms)
+            matches = sa.or_(document.bool_op("@@")(ts_query),
+                             Post.name.op("%")(text))
+            rank = sa.func.greatest(sa.func.ts_rank(document, ts_query),
+                                    sa.func.similarity(Post.name, text))
+        else:
+            matches = Post.name.op("%")(text)
+            rank = sa.func.similarity(Post.name, text)
+
+        return query.filter(matches).order_by(rank.desc(), Post.id)
+
+    @staticmethod
+    def terms(text):
+        words = re.findall(r"\w+", text.lower())
+        return " & ".join(f"{word}:*" for word in words)
+
+    @staticmethod
+    def escape(text):
+        return re.sub(r"([\\%_])", r"\\\1", text)
+
+    @staticmethod
+    def is_postgresql(db_sess):
+        return db_sess.get_bind().dialect.name == "postgresql"
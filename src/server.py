@@ -0,0 +1,30 @@
+from gunicorn.app.base import BaseApplication
+
+from src.wsgi import create_app
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, server):
+        self.server = server
+        super().__init__()
+
+    def load_config(self):
+        server = self.server
+        options = {
+            "bind": f"{server.host}:{server.port}",
+            "workers": server.workers,
+            "threads": server.threads,
+            "worker_class": "gthread" if server.threads > 1 else "sync",
+            "keepalive": server.keepalive,
+            "timeout": server.timeout,
+            "graceful_timeout": server.graceful_timeout,
+            "max_requests": server.max_requests,
+            "max_requests_jitter": server.max_requests // 10,
+            "preload_app": server.preload
+        }
+
+        for key, value in options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return create_app()
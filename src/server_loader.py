@@ -2,12 +2,35 @@ import json
 
 
 class ServerLoader:
+    DEFAULTS = {
+        "mode": "development",
+        "workers": 4,
+        "threads": 8,
+        "keepalive": 5,
+        "timeout": 30,
+        "graceful_timeout": 30,
+        "max_requests": 0,
+        "preload": False
+    }
+
     def __init__(self, path):
         self.host, self.port = None, None
+        self.mode = None
+        self.workers, self.threads = None, None
+        self.keepalive, self.timeout, self.graceful_timeout = None, None, None
+        self.max_requests, self.preload = None, None
         self.load_server(path)
 
     def load_server(self, path):
         with open(path, "r") as file:
-            server_data = json.load(file)
+            server_data = {**self.DEFAULTS, **json.load(file)}
 
         self.host, self.port = server_data["host"], server_data["port"]
+        self.mode = server_data["mode"]
+        self.workers = int(server_data["workers"])
+        self.threads = int(server_data["threads"])
+        self.keepalive = int(server_data["keepalive"])
+        self.timeout = int(server_data["timeout"])
+        self.graceful_timeout = int(server_data["graceful_timeout"])
+        self.max_requests = int(server_data["max_requests"])
+        self.preload = bool(server_data["preload"])
@@ -0,0 +1,346 @@
+import time
+import datetime
+import threading
+import heapq
+import itertools
+
+import numpy as np
+import sqlalchemy as sa
+
+from data import db_session
+from data.models.post import Post
+from src.nutrition import MACROS
+
+COORDINATE_BITS = 15
+COORDINATE_OFFSET = 1 << (COORDINATE_BITS - 1)
+DIMENSIONS = len(MACROS)
+
+
+def spread(values):
+    codes = np.zeros(len(values), dtype=np.int64)
+    for bit in range(COORDINATE_BITS):
+        codes |= ((values >> bit) & 1) << (bit * DIMENSIONS)
+    return codes
+
+
+SPREAD = spread(np.arange(1 << COORDINATE_BITS, dtype=np.int64))
+
+
+def interleave(coordinates):
+    codes = np.zeros(len(coordinates), dtype=np.int64)
+    for dimension in range(DIMENSIONS):
+        codes |= SPREAD[coordinates[:, dimension]] << dimension
+    return codes
+
+
+class MacroIndex:
+    CELL_POPULATION = 0.25
+    LEAF_SIZE = 256
+    MAX_RADIUS = 2
+
+    def __init__(self, ids, macros):
+        ids = np.asarray(ids, dtype=np.int64)
+        macros = np.nan_to_num(np.asarray(macros, dtype=np.float32)
+                               .reshape(-1, DIMENSIONS))
+
+        self.scale = macros.std(axis=0) if len(ids) > 1 \
+            else np.ones(DIMENSIONS, dtype=np.float32)
+        self.scale[self.scale < 1e-6] = 1
+        vectors = self.normalize(macros)
+        self.cell = self.cell_size(vectors)
+
+        codes = interleave(self.coordinates(vectors))
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.ids, self.macros = ids[order], macros[order]
+        self.vectors = vectors[order]
+        self.stale = np.zeros(len(ids), dtype=bool)
+        self.by_id = np.argsort(self.ids)
+        self.children = np.array(list(itertools.product(
+            (0, 1), repeat=DIMENSIONS)), dtype=np.int64)[:, ::-1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, meal_id):
+        position = np.searchsorted(self.ids, meal_id, sorter=self.by_id)
+        if position < len(self.ids) and \
+                self.ids[self.by_id[position]] == meal_id:
+            return int(self.by_id[position])
+        return None
+
+    def normalize(self, macros):
+        return (np.asarray(macros, dtype=np.float32) / self.scale) \
+            .astype(np.float32)
+
+    def cell_size(self, vectors):
+        if len(vectors) < 2:
+            return 1.0
+        low, high = np.percentile(vectors, [1, 99], axis=0)
+        volume = float(np.prod(np.maximum(high - low, 1e-3)))
+        cells = max(len(vectors) / self.CELL_POPULATION, 1)
+        return max((volume / cells) ** (1 / DIMENSIONS), 1e-3)
+
+    def coordinates(self, vectors):
+        return np.clip(np.floor(vectors / self.cell).astype(np.int64) +
+                       COORDINATE_OFFSET, 0, (1 << COORDINATE_BITS) - 1)
+
+    def neighbour_codes(self, coordinates, radius):
+        codes = np.zeros(1, dtype=np.int64)
+        for dimension, coordinate in enumerate(coordinates.tolist()):
+            steps = SPREAD[max(coordinate - radius, 0):
+                           coordinate + radius + 1] << dimension
+            codes = (codes[:, None] | steps[None, :]).ravel()
+        return codes
+
+    def gather(self, starts, ends):
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        rows = np.arange(total, dtype=np.int64) + shifts
+        return rows[~self.stale[rows]]
+
+    def nearest(self, vector, limit):
+        coordinates = self.coordinates(vector)
+        for radius in range(1, self.MAX_RADIUS + 1):
+            codes = self.neighbour_codes(coordinates, radius)
+            rows = self.gather(np.searchsorted(self.codes, codes),
+                               np.searchsorted(self.codes, codes + 1))
+
+            distances = np.linalg.norm(self.vectors[rows] - vector, axis=1)
+            if len(rows) > limit:
+                best = np.argpartition(distances, limit - 1)[:limit]
+                rows, distances = rows[best], distances[best]
+            if len(rows) == limit and distances.max() <= self.cell * radius:
+                return rows, distances
+
+        return self.search(vector, limit, distances)
+
+    def search(self, vector, limit, seed_distances):
+        cutoff = seed_distances.max() if len(seed_distances) == limit \
+            else np.inf
+        origin = vector / self.cell + COORDINATE_OFFSET
+        best_rows = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float32)
+
+        queue = [(0.0, 0, COORDINATE_BITS, 0, 0, len(self.codes),
+                  np.zeros(DIMENSIONS, dtype=np.int64))]
+        counter = itertools.count(1)
+        while queue:
+            bound, _, level, prefix, start, end, corner = \
+                heapq.heappop(queue)
+            if bound > cutoff:
+                break
+
+            if end - start <= self.LEAF_SIZE or level == 0:
+                rows = np.arange(start, end)[~self.stale[start:end]]
+                distances = np.linalg.norm(self.vectors[rows] - vector,
+                                           axis=1)
+                best_rows = np.concatenate([best_rows, rows])
+                best_distances = np.concatenate([best_distances, distances])
+                if len(best_rows) > limit:
+                    best = np.argpartition(best_distances, limit - 1)[:limit]
+                    best_rows = best_rows[best]
+                    best_distances = best_distances[best]
+                if len(best_rows) == limit:
+                    cutoff = min(cutoff, best_distances.max())
+                continue
+
+            level -= 1
+            prefixes = (prefix << DIMENSIONS) + \
+                np.arange((1 << DIMENSIONS) + 1)
+            bounds = np.searchsorted(self.codes,
+                                     prefixes << (level * DIMENSIONS))
+            corners = (corner << 1) + self.children
+            low = corners << level
+            gaps = np.maximum(np.maximum(low - origin,
+                                         origin - low - (1 << level)), 0)
+            distances = np.sqrt((gaps ** 2).sum(axis=1)) * self.cell
+
+            for child in np.flatnonzero(bounds[1:] > bounds[:-1]):
+                if distances[child] <= cutoff:
+                    heapq.heappush(queue, (
+                        float(distances[child]), next(counter), level,
+                        int(prefixes[child]), int(bounds[child]),
+                        int(bounds[child + 1]), corners[child]))
+
+        return best_rows, best_distances
+
+
+class SimilarMeals:
+    LIMIT = 6
+    MAX_LIMIT = 50
+    REFRESH_INTERVAL = 30
+    REBUILD_INTERVAL = 3600
+    REBUILD_DELTA = 10000
+    REFRESH_OVERLAP = 60
+    VERSION_KEY = "similar_meals"
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL,
+                 rebuild_interval=REBUILD_INTERVAL,
+                 rebuild_delta=REBUILD_DELTA, versions=None):
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.rebuild_delta = rebuild_delta
+        self.versions = versions
+        self.version = versions.get(self.VERSION_KEY) \
+            if versions is not None else None
+        self.index = None
+        self.delta = {}
+        self.delta_arrays = None
+        self.watermark = None
+        self.built_at = 0.0
+        self.thread = None
+        self.ready = threading.Event()
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, versions=None):
+        return cls(settings.get("refresh_interval", cls.REFRESH_INTERVAL),
+                   settings.get("rebuild_interval", cls.REBUILD_INTERVAL),
+                   settings.get("rebuild_delta", cls.REBUILD_DELTA),
+                   versions)
+
+    def start(self):
+        if self.versions is not None:
+            version = self.versions.get(self.VERSION_KEY)
+            if version != self.version:
+                self.version = version
+                self.wake.set()
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.maintain,
+                                               name="similar-meals",
+                                               daemon=True)
+                self.thread.start()
+
+    def maintain(self):
+        while True:
+            try:
+                if self.index is None or \
+                        time.monotonic() - self.built_at > \
+                        self.rebuild_interval or \
+                        len(self.delta) > self.rebuild_delta:
+                    self.rebuild(db_session.create_session())
+                else:
+                    self.refresh(db_session.create_session())
+            except sa.exc.SQLAlchemyError as error:
+                print(f"Не удалось обновить индекс похожих блюд: {error}")
+            finally:
+                db_session.remove_session()
+
+            self.wake.wait(self.refresh_interval)
+            self.wake.clear()
+
+    def rebuild(self, db_sess):
+        started = time.monotonic()
+        watermark = db_sess.query(sa.func.max(Post.update_date)).scalar()
+
+        ids, macros = [], []
+        rows = db_sess.execute(sa.select(Post.id, *[getattr(Post, macro)
+                                                    for macro in MACROS])
+                               .execution_options(yield_per=50000))
+        for partition in rows.partitions():
+            ids.extend(row[0] for row in partition)
+            macros.extend(row[1:] for row in partition)
+
+        index = MacroIndex(ids,
+                           np.array(macros, dtype=np.float64)
+                           .reshape(-1, DIMENSIONS))
+        with self.lock:
+            self.delta = {meal_id: entry for meal_id, entry
+                          in self.delta.items() if entry[1] >= started}
+            for meal_id in self.delta:
+                position = index.find(meal_id)
+                if position is not None:
+                    index.stale[position] = True
+            self.index = index
+            self.delta_arrays = None
+            self.watermark = watermark
+            self.built_at = started
+        self.ready.set()
+
+    def refresh(self, db_sess):
+        query = sa.select(Post.id, Post.update_date,
+                          *[getattr(Post, macro) for macro in MACROS]) \
+            .order_by(Post.update_date)
+        if self.watermark is not None:
+            query = query.where(Post.update_date >= self.watermark -
+                                datetime.timedelta(
+                                    seconds=self.REFRESH_OVERLAP))
+
+        rows = db_sess.execute(query).all()
+        for row in rows:
+            self.update(row[0], row[2:])
+        if rows:
+            self.watermark = max(self.watermark or rows[-1][1], rows[-1][1])
+
+    def update(self, meal_id, macros):
+        macros = np.array([0 if value is None else value for value in macros],
+                          dtype=np.float32)
+        with self.lock:
+            index = self.index
+            position = index.find(meal_id) if index is not None else None
+            if position is not None:
+                unchanged = np.array_equal(index.macros[position], macros)
+                index.stale[position] = not unchanged
+                if unchanged:
+                    if self.delta.pop(meal_id, None) is not None:
+                        self.delta_arrays = None
+                    return
+            self.delta[meal_id] = (macros, time.monotonic())
+            self.delta_arrays = None
+        if len(self.delta) > self.rebuild_delta:
+            self.wake.set()
+
+    def snapshot(self):
+        with self.lock:
+            if self.delta_arrays is None:
+                ids = np.fromiter(self.delta, dtype=np.int64,
+                                  count=len(self.delta))
+                macros = np.array([entry[0] for entry in self.delta.values()],
+                                  dtype=np.float32).reshape(-1, DIMENSIONS)
+                self.delta_arrays = (ids, macros)
+            return self.index, self.delta_arrays
+
+    def similar(self, meal_id, macros, limit=LIMIT):
+        limit = min(max(limit, 1), self.MAX_LIMIT)
+        self.start()
+        index, (delta_ids, delta_macros) = self.snapshot()
+        if index is None:
+            return []
+
+        vector = index.normalize([0 if value is None else value
+                                  for value in macros])
+        rows, distances = index.nearest(vector, limit + 1)
+        found = [(float(distance), int(index.ids[row]), index.macros[row])
+                 for row, distance in zip(rows, distances)]
+
+        if len(delta_ids):
+            delta_distances = np.linalg.norm(
+                index.normalize(delta_macros) - vector, axis=1)
+            nearest = np.argsort(delta_distances)[:limit + 1]
+            found.extend(zip(delta_distances[nearest].tolist(),
+                             delta_ids[nearest].tolist(),
+                             delta_macros[nearest]))
+
+        found.sort(key=lambda item: item[0])
+        return [{"id": found_id, "distance": round(distance, 4),
+                 **{macro: round(float(value), 4)
+                    for macro, value in zip(MACROS, found_macros)}}
+                for distance, found_id, found_macros in found
+                if found_id != meal_id][:limit]
+
+    def catalog(self, timeout=None):
+        self.start()
+        self.ready.wait(timeout)
+        index, (delta_ids, delta_macros) = self.snapshot()
+        if index is None:
+            return None
+
+        live = ~index.stale
+        return (np.concatenate([index.ids[live], delta_ids]),
+                np.concatenate([index.macros[live], delta_macros]))
@@ -0,0 +1,51 @@
+import sqlalchemy as sa
+
+from data import db_session
+from data.models.post import Post
+from data.models.subscription import Subscription
+
+
+class Subscriptions:
+    @staticmethod
+    def subscribe(db_sess, user_id, meal_id):
+        statement = db_session.insert(db_sess, Subscription.__table__) \
+            .values(user_id=user_id, meal_id=meal_id) \
+            .on_conflict_do_nothing(index_elements=["user_id", "meal_id"])
+
+        if db_sess.execute(statement).rowcount != 1:
+            return False
+
+        Subscriptions.change_count(db_sess, meal_id, 1)
+        return True
+
+    @staticmethod
+    def unsubscribe(db_sess, user_id, meal_id):
+        statement = sa.delete(Subscription.__table__).where(
+            Subscription.user_id == user_id,
+            Subscription.meal_id == meal_id)
+
+        if db_sess.execute(statement).rowcount != 1:
+            return False
+
+        Subscriptions.change_count(db_sess, meal_id, -1)
+        return True
+
+    @staticmethod
+    def is_subscribed(db_sess, user_id, meal_id):
+        return db_sess.query(sa.exists().where(
+            Subscription.user_id == user_id,
+            Subscription.meal_id == meal_id)).scalar()
+
+    @staticmethod
+    def change_count(db_sess, meal_id, delta):
+        db_sess.execute(sa.update(Post.__table__)
+                        .where(Post.id == meal_id)
+                        .values(subscribers_count=Post.subscribers_count +
+                                delta))
+
+    @staticmethod
+    def recount(db_sess):
+        counts = sa.select(sa.func.count()).where(
+            Subscription.meal_id == Post.id).scalar_subquery()
+        return db_sess.execute(sa.update(Post.__table__)
+                               .values(subscribers_count=counts)).rowcount
@@ -0,0 +1,135 @@
+import json
+import weakref
+import datetime
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+from flask_login import UserMixin
+
+from data.models.user import User
+from src.cache import LocalBackend
+
+caches = weakref.WeakSet()
+
+
+class UserSnapshot(UserMixin):
+    FIELDS = ("id", "username", "email", "age", "register_date")
+
+    def __init__(self, id, username, email, age, register_date,
+                 version=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.age = age
+        self.register_date = register_date
+        self.version = version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(**{field: getattr(user, field) for field in cls.FIELDS})
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["version"] = self.version
+        if self.register_date is not None:
+            data["register_date"] = self.register_date.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data["register_date"] is not None:
+            data["register_date"] = datetime.datetime.fromisoformat(
+                data["register_date"])
+        return cls(**data)
+
+
+class RedisBackend:
+    PREFIX = "mealty:user:"
+
+    def __init__(self, ttl, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("redis package is required for the redis "
+                               "user cache backend")
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+        self.errors = redis.RedisError
+
+    def get(self, key):
+        try:
+            data = self.client.get(self.PREFIX + str(key))
+        except self.errors:
+            return None
+
+        if data is None:
+            return None
+        return UserSnapshot.from_dict(json.loads(data))
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.PREFIX + str(key),
+                            json.dumps(value.to_dict()), ex=self.ttl)
+        except self.errors:
+            pass
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.PREFIX + str(key))
+        except self.errors:
+            pass
+
+
+class UserCache:
+    def __init__(self, backend, versions):
+        self.backend = backend
+        self.versions = versions
+        caches.add(self)
+
+    @classmethod
+    def from_settings(cls, settings, versions):
+        ttl = settings.get("ttl", 300)
+        if settings.get("backend", "local") == "redis":
+            return cls(RedisBackend(ttl, settings["redis_url"]), versions)
+        return cls(LocalBackend(ttl, settings.get("size", 10000)), versions)
+
+    def get(self, user_id, loader):
+        version = self.versions.get(user_id)
+        snapshot = self.backend.get(user_id)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        user = loader(user_id)
+        if user is None:
+            return None
+        return self.put(user, version)
+
+    def put(self, user, version=None):
+        snapshot = UserSnapshot.from_user(user)
+        snapshot.version = self.versions.get(snapshot.id) \
+            if version is None else version
+        self.backend.set(snapshot.id, snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        self.versions.bump(user_id)
+        self.backend.delete(user_id)
+
+
+@sa.event.listens_for(User, "after_update")
+def collect_user(mapper, connection, user):
+    session = orm.object_session(user)
+    if session is not None:
+        session.info.setdefault("updated_users", set()).add(user.id)
+
+
+@sa.event.listens_for(orm.Session, "after_commit")
+def invalidate_users(session):
+    for user_id in session.info.pop("updated_users", ()):
+        for cache in list(caches):
+            cache.invalidate(user_id)
+
+
+@sa.event.listens_for(orm.Session, "after_rollback")
+def forget_users(session):
+    session.info.pop("updated_users", None)
@@ -0,0 +1,5 @@
+from src.app import App
+
+
+def create_app():
+    return App("main").get_app()
@@ -0,0 +1,27 @@
+const nameInput = document.getElementById(document.currentScript.dataset.nameInput);
+const mealNames = document.getElementById("meal-names");
+let lastPrefix = "";
+
+nameInput.addEventListener("input", () => {
+    const prefix = nameInput.value.trim();
+    if (prefix.length < 2 || prefix === lastPrefix) {
+        return;
+    }
+    lastPrefix = prefix;
+
+    fetch("/api/meals/autocomplete?q=" + encodeURIComponent(prefix))
+        .then(response => response.json())
+        .then(names => {
+            if (prefix !== lastPrefix) {
+                return;
+            }
+            mealNames.replaceChildren(...names.map(name => new Option(name)));
+        });
+});
+
+document.querySelectorAll(".meal-suggestion").forEach(link => {
+    link.addEventListener("click", event => {
+        event.preventDefault();
+        nameInput.value = link.textContent;
+    });
+});
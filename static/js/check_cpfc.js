@@ -0,0 +1,23 @@
+const chart = document.getElementById("chart");
+const chartStatus = document.getElementById("chart-status");
+let attempts = 0;
+
+function loadChart() {
+    attempts += 1;
+    const probe = new Image();
+    probe.onload = () => {
+        chart.src = probe.src;
+        chart.hidden = false;
+        chartStatus.remove();
+    };
+    probe.onerror = () => {
+        if (attempts < 30) {
+            setTimeout(loadChart, 1000);
+        } else {
+            chartStatus.textContent = "Chart could not be drawn, submit again later";
+        }
+    };
+    probe.src = chart.dataset.src;
+}
+
+setTimeout(loadChart, 500);
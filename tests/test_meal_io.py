@@ -0,0 +1,20 @@
+import io
+
+import pytest
+
+from src.meal_io import MealImporter, MealImportError
+
+
+@pytest.mark.parametrize("record", [[1, 2], "x", 5, None])
+def test_normalize_rejects_non_objects(record):
+    with pytest.raises(MealImportError, match="Expected a JSON object"):
+        MealImporter(None).normalize(record)
+
+
+def test_run_reports_non_object_lines():
+    importer = MealImporter(None)
+    stream = io.BytesIO(b'[1, 2]\n"x"\n5\n')
+    results = list(importer.run(importer.read(stream, "jsonl")))
+
+    assert results[-1].processed == 3
+    assert [error["line"] for error in results[-1].errors] == [1, 2, 3]